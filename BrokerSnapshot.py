@@ -0,0 +1,65 @@
+import threading
+import time
+from concurrent.futures import Future
+from Metrics import metrics
+
+
+class BrokerSnapshot:
+    """
+    保存券商查詢結果的快照：同一資源在 ttl 秒內只查詢一次，多個執行緒同時查詢同一資源時共用同一個請求
+    """
+    def __init__(self, ttl=None):
+        """
+        :param ttl: 快照的有效秒數，None 表示直到 refresh() 前都有效 (即每次執行只查詢一次)
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._inflight = {}
+
+    def _is_fresh(self, entry):
+        return self.ttl is None or time.monotonic() - entry[0] <= self.ttl
+
+    def get(self, key, fetch, refresh=False):
+        """
+        取得 key 的快照，沒有有效快照時以 fetch() 查詢
+
+        :param refresh: 忽略既有快照重新查詢 (已有進行中的查詢時直接共用其結果)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not refresh and self._is_fresh(entry):
+                metrics.cache('snapshot', key.split(':')[0], True)
+                return entry[1]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            metrics.cache('snapshot', key.split(':')[0], True)
+            return future.result()
+
+        metrics.cache('snapshot', key.split(':')[0], False)
+        try:
+            value = fetch()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            del self._inflight[key]
+        future.set_result(value)
+        return value
+
+    def refresh(self, *keys):
+        """
+        清除指定資源的快照，未指定時清除全部，下次取得時會重新查詢
+        """
+        with self._lock:
+            if keys:
+                for key in keys:
+                    self._entries.pop(key, None)
+            else:
+                self._entries.clear()
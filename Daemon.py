@@ -0,0 +1,241 @@
+"""
+常駐模式：維持一個已登入的券商連線及預熱的市場資料，由程序內的排程器執行每日報表、盤中快照及即時更新等工作
+"""
+import signal
+import time
+import traceback
+from datetime import datetime, timedelta
+
+# 券商連線逾期時錯誤訊息中常見的關鍵字
+SESSION_ERROR_KEYWORDS = ('token', 'session', 'expired', 'login', 'unauthorized', '登入')
+
+
+def is_session_error(error):
+    """
+    判斷例外是否為券商連線逾期或尚未登入所造成
+    """
+    message = f'{type(error).__name__} {error}'.lower()
+    return any(keyword in message for keyword in SESSION_ERROR_KEYWORDS)
+
+
+def parse_clock(text):
+    hour, minute = text.split(':')
+    return int(hour), int(minute)
+
+
+def daily_at(clock, weekdays=range(5)):
+    """
+    每日固定時間執行，例如 daily_at('22:00') 為週一至週五 22:00
+
+    :param clock: 執行時間 (HH:MM)
+    :param weekdays: 執行的星期 (0 為週一)
+    :return: 依目前時間計算下次執行時間的函式
+    """
+    hour, minute = parse_clock(clock)
+    weekdays = set(weekdays)
+
+    def next_time(now):
+        candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate <= now:
+            candidate += timedelta(days=1)
+        while candidate.weekday() not in weekdays:
+            candidate += timedelta(days=1)
+        return candidate
+    return next_time
+
+
+def every(minutes, start='09:00', end='13:30', weekdays=range(5)):
+    """
+    在每日 start 至 end 之間每隔 minutes 分鐘執行一次，例如盤中快照
+
+    :return: 依目前時間計算下次執行時間的函式
+    """
+    start_clock, end_clock = parse_clock(start), parse_clock(end)
+    weekdays = set(weekdays)
+
+    def next_time(now):
+        day = now.replace(second=0, microsecond=0)
+        for _ in range(8):
+            opening = day.replace(hour=start_clock[0], minute=start_clock[1])
+            closing = day.replace(hour=end_clock[0], minute=end_clock[1])
+            if day.weekday() in weekdays and now < closing:
+                if now < opening:
+                    return opening
+                elapsed = (now - opening) // timedelta(minutes=minutes) + 1
+                candidate = opening + elapsed * timedelta(minutes=minutes)
+                if candidate <= closing:
+                    return candidate
+            day = (day + timedelta(days=1)).replace(hour=0, minute=0)
+        return None
+    return next_time
+
+
+class Job:
+    def __init__(self, name, func, next_time=None):
+        """
+        :param func: 工作內容，不需參數
+        :param next_time: 依目前時間計算下次執行時間的函式，None 表示只在被觸發時執行
+        """
+        self.name = name
+        self.func = func
+        self.next_time = next_time
+        self.next_run = None
+        self.last_run = None
+        self.last_error = None
+        self.runs = 0
+
+    def schedule(self, now):
+        self.next_run = self.next_time(now) if self.next_time else None
+
+
+class Scheduler:
+    """
+    程序內的排程器：所有工作在同一個執行緒中依序執行 (共用同一個券商連線)，
+    收到 SIGTERM/SIGINT 時等目前的工作完成後結束
+    """
+    def __init__(self, poll_interval=1.0):
+        self.jobs = {}
+        self.poll_interval = poll_interval
+        self._triggered = []
+        self._stopping = False
+
+    def add(self, name, func, next_time=None):
+        self.jobs[name] = Job(name, func, next_time)
+        return self.jobs[name]
+
+    def trigger(self, name):
+        """
+        要求立即執行指定工作，可在訊號處理函式或其他執行緒中呼叫
+        """
+        if name not in self.jobs:
+            raise ValueError(f'未知的工作: {name}')
+        self._triggered.append(name)
+
+    def stop(self, *args):
+        self._stopping = True
+
+    @property
+    def stopping(self):
+        return self._stopping
+
+    def install_signal_handlers(self, refresh_job=None):
+        """
+        SIGTERM/SIGINT 結束常駐模式；SIGUSR1 立即執行 refresh_job
+        """
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        if refresh_job is not None and hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda *args: self.trigger(refresh_job))
+
+    def run_job(self, job):
+        started_at = datetime.now()
+        print(f'[{started_at:%Y-%m-%d %H:%M:%S}] 開始執行工作 {job.name}')
+        try:
+            job.func()
+            job.last_error = None
+        except Exception as e:
+            job.last_error = e
+            print(f'工作 {job.name} 執行失敗: {e}')
+            traceback.print_exc()
+        job.last_run = started_at
+        job.runs += 1
+        print(f'工作 {job.name} 結束，耗時 {(datetime.now() - started_at).total_seconds():.2f} 秒')
+
+    def due_jobs(self, now):
+        due = []
+        while self._triggered:
+            name = self._triggered.pop(0)
+            if name not in due:
+                due.append(name)
+        due += [name for name, job in self.jobs.items()
+                if job.next_run is not None and job.next_run <= now and name not in due]
+        return [self.jobs[name] for name in due]
+
+    def run(self):
+        now = datetime.now()
+        for job in self.jobs.values():
+            job.schedule(now)
+            if job.next_run:
+                print(f'工作 {job.name} 下次執行時間: {job.next_run:%Y-%m-%d %H:%M}')
+        while not self._stopping:
+            for job in self.due_jobs(datetime.now()):
+                if self._stopping:
+                    break
+                self.run_job(job)
+                # 以完成時間計算下次執行時間，執行過久而錯過的排程不會連續補跑
+                job.schedule(datetime.now())
+            time.sleep(self.poll_interval)
+        print('常駐模式結束')
+
+
+class AccountSession:
+    """
+    維持一個已登入的 ShioajiStockAccount；連線超過 max_age 秒或因連線逾期失敗時自動重新登入
+    """
+    def __init__(self, api_key, secret_key, max_age=None):
+        self.api_key = api_key
+        self.secret_key = secret_key
+        self.max_age = max_age
+        self._account = None
+        self._logged_in_at = None
+        self.logins = 0
+
+    @property
+    def account(self):
+        if self._account is None or (self.max_age and time.monotonic() - self._logged_in_at > self.max_age):
+            self.login()
+        return self._account
+
+    def login(self):
+        from StockAccount import ShioajiStockAccount
+        self.logout()
+        self._account = ShioajiStockAccount(api_key=self.api_key, secret_key=self.secret_key)
+        self._logged_in_at = time.monotonic()
+        self.logins += 1
+        print('券商登入完成')
+
+    def logout(self):
+        if self._account is None:
+            return
+        try:
+            self._account.logout()
+            print('logout')
+        except Exception as e:
+            # 連線已逾期時登出也可能失敗，不影響後續重新登入
+            print(f'登出失敗: {e}')
+        self._account = None
+
+    def run(self, func):
+        """
+        以目前的連線執行 func(account)，因連線逾期失敗時重新登入後再試一次
+        """
+        try:
+            return func(self.account)
+        except Exception as e:
+            if not is_session_error(e):
+                raise
+            print(f'券商連線已失效 ({e})，重新登入')
+            self.login()
+            return func(self.account)
+
+
+class WarmValue:
+    """
+    在 ttl 秒內重複使用已建立的值 (例如 ETFCategory)，過期後才重新建立；建立失敗時沿用舊值
+    """
+    def __init__(self, factory, ttl):
+        self.factory = factory
+        self.ttl = ttl
+        self._value = None
+        self._loaded_at = None
+
+    def get(self):
+        if self._value is None or time.monotonic() - self._loaded_at > self.ttl:
+            try:
+                self._value = self.factory()
+                self._loaded_at = time.monotonic()
+            except Exception as e:
+                if self._value is None:
+                    raise
+                print(f'更新失敗，沿用先前的資料: {e}')
+        return self._value
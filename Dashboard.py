@@ -0,0 +1,353 @@
+"""
+本地儀表板：以 HTTP 提供持倉歷史中任一快照日期的圖表 (單一圖表方法、預設布局或自訂布局)，
+繪製的圖片保存於有數量及大小上限的 LRU 快取中，重複瀏覽及多人同時瀏覽時不會重新繪製
+
+路徑：
+    /                                   各快照日期的圖表索引
+    /chart/<YYYYMMDD|latest>/<布局>.<格式>  圖片，布局為預設布局名稱、圖表方法名稱或以逗號分隔的多個圖表方法
+                                        (可搭配 ?cols= 指定欄數)，格式為 jpg、png 或 webp，?dpi= 指定解析度
+    /api/dates                          快照日期列表
+    /api/stats                          快取命中次數、大小及繪製耗時
+"""
+import html
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from Metrics import metrics
+
+CONTENT_TYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'}
+DEFAULT_DPI = 100
+MIN_DPI, MAX_DPI = 30, 300
+# 自訂布局最多的圖表數量
+MAX_LAYOUT_CHARTS = 12
+
+
+class RenderCache:
+    """
+    以 (日期, 布局, DPI, 格式) 為鍵保存繪製後的圖片，超過數量或總大小上限時淘汰最久未使用的圖片；
+    同一張圖片同時被多個請求時只繪製一次
+    """
+    def __init__(self, max_entries=128, max_bytes=128 * 1024 * 1024, latency_window=1000):
+        """
+        :param max_entries: 保存的圖片數量上限
+        :param max_bytes: 保存的圖片總大小上限 (位元組)，單張超過上限的圖片不會保存
+        :param latency_window: 計算繪製耗時百分位數時保留的最近次數
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # 每次 clear() 加一；開始繪製後世代改變的圖片不保存
+        self.generation = 0
+        self._latencies = deque(maxlen=latency_window)
+
+    def get(self, key, render, generation=None):
+        """
+        取得 key 的圖片，快取中沒有時以 render() 繪製
+
+        :param generation: render() 所用資料讀取時的世代，預設為目前的世代；與保存時的世代不同時不保存圖片
+        """
+        with self._lock:
+            if generation is None:
+                generation = self.generation
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                metrics.cache('dashboard', 'render', True)
+                return self._entries[key]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self.hits += 1
+        if not owner:
+            metrics.cache('dashboard', 'render', True)
+            return future.result()
+
+        metrics.cache('dashboard', 'render', False)
+        started_at = time.perf_counter()
+        try:
+            with metrics.timer('dashboard', 'render'):
+                value = render()
+        except BaseException as e:
+            with self._lock:
+                self._release(key, future)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self.misses += 1
+            self._latencies.append(time.perf_counter() - started_at)
+            self._release(key, future)
+            if generation == self.generation:
+                self._store(key, value)
+        future.set_result(value)
+        return value
+
+    def _release(self, key, future):
+        # clear() 之後同一個 key 可能已有新的繪製
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+
+    def _store(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        self._entries[key] = value
+        self.size += len(value)
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._inflight.clear()
+            self.size = 0
+            self.generation += 1
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            requests = self.hits + self.misses
+
+            def percentile(p):
+                return latencies[min(int(len(latencies) * p), len(latencies) - 1)] if latencies else None
+
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / requests if requests else None,
+                'render_seconds': {
+                    'count': len(latencies),
+                    'mean': sum(latencies) / len(latencies) if latencies else None,
+                    'p50': percentile(0.5),
+                    'p95': percentile(0.95),
+                    'max': latencies[-1] if latencies else None,
+                },
+            }
+
+
+class Dashboard:
+    """
+    讀取持倉歷史中的快照並繪製圖表；各日期的 PositionFigure 會保留其彙總資料，持倉歷史更新時清除所有快取
+    """
+    def __init__(self, private_output_dir, layouts, cache=None, max_figures=8):
+        """
+        :param private_output_dir: 持倉歷史資料庫所在的資料夾
+        :param layouts: 預設布局，{名稱: chart_configs}
+        :param cache: 圖片快取，預設為 RenderCache()
+        :param max_figures: 保留 PositionFigure 的日期數上限
+        """
+        from HistoryStore import PositionHistory, PortfolioSeries
+        self.history_path = f'{private_output_dir}/position_history.db'
+        self.position_history = PositionHistory(self.history_path)
+        self.series = PortfolioSeries(self.position_history)
+        self.layouts = layouts
+        self.cache = cache or RenderCache()
+        self.max_figures = max_figures
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+        self._history_version = None
+
+    def check_history(self):
+        # 持倉歷史資料庫有變更時 (例如常駐模式寫入新的快照)，舊的圖片及彙總資料都不再使用
+        with self._lock:
+            if os.path.getmtime(self.history_path) == self._history_version:
+                return
+            # 更新時間序列也會寫入同一個資料庫，以更新後的修改時間為準
+            self.series.update()
+            self._history_version = os.path.getmtime(self.history_path)
+            self._figures.clear()
+        self.cache.clear()
+
+    def dates(self):
+        self.check_history()
+        return self.position_history.dates()
+
+    def parse_date(self, text):
+        """
+        :param text: YYYYMMDD 或 latest
+        :return: 快照日期，沒有該日快照時回傳 None
+        """
+        dates = self.dates()
+        if text == 'latest':
+            return dates[-1] if dates else None
+        try:
+            date = datetime.strptime(text, '%Y%m%d')
+        except ValueError:
+            return None
+        return date if date in dates else None
+
+    def figure(self, date):
+        from GenFigure import PositionFigure
+        with self._lock:
+            if date in self._figures:
+                self._figures.move_to_end(date)
+                return self._figures[date]
+        positions = self.position_history.read(start=date, end=date).drop(columns=['日期'])
+        figure = PositionFigure(positions, series=self.series.read(end=date))
+        with self._lock:
+            self._figures[date] = figure
+            while len(self._figures) > self.max_figures:
+                self._figures.popitem(last=False)
+        return figure
+
+    def chart_configs(self, layout, cols=None):
+        """
+        將布局名稱轉為 chart_configs，未知的圖表方法回傳 None
+
+        :param layout: 預設布局名稱、圖表方法名稱，或以逗號分隔的多個圖表方法
+        :param cols: 自訂布局的欄數，預設為 2
+        """
+        from GenFigure import CHART_INPUTS
+        if layout in self.layouts:
+            return self.layouts[layout]
+        charts = [name for name in layout.split(',') if name]
+        if not charts or len(charts) > MAX_LAYOUT_CHARTS or any(name not in CHART_INPUTS for name in charts):
+            return None
+        cols = min(cols or 2, len(charts))
+        return [[name, (i // cols, i % cols), (1, 1)] for i, name in enumerate(charts)]
+
+    @staticmethod
+    def uses_history(chart_configs):
+        from GenFigure import CHART_INPUTS
+        return any(key in ('allocation', 'summary')
+                   for method_name, _, _ in chart_configs for key, _ in CHART_INPUTS[method_name])
+
+    def render(self, date, layout, dpi=DEFAULT_DPI, format='jpg', cols=None):
+        """
+        取得圖片的位元組內容，快取中沒有時才繪製
+
+        :raises LookupError: 日期或布局不存在，或持倉歷史不足以繪製歷史走勢圖
+        """
+        from GenFigure import encode_bytes
+        chart_configs = self.chart_configs(layout, cols)
+        if chart_configs is None:
+            raise LookupError(f'未知的布局: {layout}')
+        # 先取得世代再讀取 PositionFigure，讀取期間持倉歷史更新時不會保存以舊資料繪製的圖片
+        generation = self.cache.generation
+        figure = self.figure(date)
+        if self.uses_history(chart_configs) and len(figure.series[1]) < 2:
+            raise LookupError('持倉歷史不足兩天，無法繪製歷史走勢圖')
+        if layout in self.layouts:
+            layout_key = layout
+        else:
+            # 以實際欄數為鍵，cols 超過圖表數時與 cols=圖表數 為同一張圖片
+            layout_key = f'{layout}@{max(col for _, (_, col), _ in chart_configs) + 1}'
+        return self.cache.get((date.strftime('%Y%m%d'), layout_key, dpi, format),
+                              lambda: encode_bytes(figure.rasterize(chart_configs, dpi), format, dpi=dpi),
+                              generation)
+
+    def index_html(self):
+        from GenFigure import CHART_INPUTS
+        rows = []
+        for date in reversed(self.dates()):
+            day = date.strftime('%Y%m%d')
+            links = ' '.join(f'<a href="/chart/{day}/{name}.png">{html.escape(name)}</a>'
+                             for name in list(self.layouts) + list(CHART_INPUTS))
+            rows.append(f'<h2>{date:%Y-%m-%d}</h2><p>{links}</p>'
+                        f'<img src="/chart/{day}/{next(iter(self.layouts))}.jpg?dpi=60" loading="lazy">')
+        body = ''.join(rows) or '<p>持倉歷史資料庫中沒有任何快照</p>'
+        return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>持倉儀表板</title></head>'
+                f'<body><h1>持倉儀表板</h1><p><a href="/api/stats">快取統計</a></p>{body}</body></html>')
+
+
+class DashboardServer:
+    def __init__(self, dashboard, host='127.0.0.1', port=8050):
+        self.dashboard = dashboard
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def send_body(self, body, content_type, status=200):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_json(self, value):
+                self.send_body(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'),
+                               'application/json; charset=utf-8')
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                parts = [p for p in url.path.split('/') if p]
+                try:
+                    if not parts:
+                        self.send_body(server.dashboard.index_html().encode('utf-8'), 'text/html; charset=utf-8')
+                    elif parts == ['api', 'dates']:
+                        self.send_json([date.strftime('%Y%m%d') for date in server.dashboard.dates()])
+                    elif parts == ['api', 'stats']:
+                        self.send_json(server.dashboard.cache.stats())
+                    elif len(parts) == 3 and parts[0] == 'chart':
+                        self.send_chart(parts[1], parts[2], query)
+                    else:
+                        self.send_error(404)
+                except Exception as e:
+                    print(f'儀表板請求 {self.path} 失敗: {e}')
+                    self.send_error(500, explain=str(e))
+
+            def send_chart(self, day, filename, query):
+                layout, _, format = filename.rpartition('.')
+                if format not in CONTENT_TYPES:
+                    self.send_error(400, explain=f'不支援的格式: {format}')
+                    return
+                try:
+                    dpi = int(query.get('dpi', [DEFAULT_DPI])[0])
+                    cols = int(query['cols'][0]) if 'cols' in query else None
+                except ValueError:
+                    self.send_error(400, explain='dpi 及 cols 須為整數')
+                    return
+                if not MIN_DPI <= dpi <= MAX_DPI or (cols is not None and cols < 1):
+                    self.send_error(400, explain=f'dpi 須介於 {MIN_DPI} 至 {MAX_DPI}，cols 須大於 0')
+                    return
+                date = server.dashboard.parse_date(day)
+                if date is None:
+                    self.send_error(404, explain=f'沒有 {day} 的快照')
+                    return
+                try:
+                    body = server.dashboard.render(date, layout, dpi=dpi, format=format, cols=cols)
+                except LookupError as e:
+                    self.send_error(404, explain=str(e))
+                    return
+                self.send_body(body, CONTENT_TYPES[format])
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,58 @@
+import json
+import os
+import threading
+import time
+
+
+class DiskCache:
+    """
+    以 JSON 檔案保存於磁碟的簡易快取，每筆資料會記錄寫入時間與額外的驗證資訊 (例如 ETag、Last-Modified)
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = self.load()
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f'Failed to load cache {self.path}: {e}')
+            return {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    @staticmethod
+    def is_fresh(entry, ttl):
+        if entry is None:
+            return False
+        if ttl is None:
+            return True
+        return time.time() - entry['saved_at'] < ttl
+
+    def put(self, key, value, **meta):
+        with self.lock:
+            self.entries[key] = {'saved_at': time.time(), 'value': value, **meta}
+            self.dirty = True
+
+    def touch(self, key):
+        # 伺服器回應內容未變更 (304) 時，僅更新寫入時間
+        with self.lock:
+            self.entries[key]['saved_at'] = time.time()
+            self.dirty = True
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
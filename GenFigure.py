@@ -1,14 +1,45 @@
 import pandas as pd
+import matplotlib
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
+from matplotlib.collections import LineCollection
+import functools
+import hashlib
+import inspect
+import io
+import json
+import multiprocessing
 import os
+import shutil
 import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from Metrics import metrics
 
+# pyplot 的目前圖表為全域狀態，多個執行緒 (例如批次模式中的各帳戶) 同時繪圖時需依序進行
+_pyplot_lock = threading.RLock()
 
-class PositionFigure:
-    def __init__(self, positions_table: pd.DataFrame):
-        self.positions = positions_table
+
+def _with_pyplot_lock(method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with _pyplot_lock:
+            return method(*args, **kwargs)
+    return wrapper
+
+
+_theme_applied = False
+
+
+def _apply_theme():
+    # 字型及 seaborn 主題為 pyplot 的全域設定，每個行程只套用一次，
+    # 避免其他執行緒建立 PositionFigure 時改變正在繪製中的圖表
+    global _theme_applied
+    with _pyplot_lock:
+        if _theme_applied:
+            return
         if sys.platform.startswith('darwin'):
             font_name = 'Arial Unicode Ms'
         elif sys.platform.startswith('win'):
@@ -17,13 +48,258 @@ class PositionFigure:
             font_name = 'WenQuanYi Zen Hei'
         plt.rcParams['font.sans-serif'] = [font_name]
         plt.rcParams['axes.unicode_minus'] = False
-        self.plt = plt
         sns.set_theme(style="whitegrid")
         sns.set(font=font_name)
+        _theme_applied = True
+
+
+# 各圖表方法實際使用的彙總資料，用於計算圖表指紋；未列出的方法以整張持倉表計算
+CHART_INPUTS = {
+    'position_pie': [('by_type', ['部位價值', '部位占比', '數量'])],
+    'loss_bar_with_type': [('by_type', ['損益'])],
+    'value_bar_chart': [('by_type', ['部位價值'])],
+    'max_holdings_text': [('max_holdings', ['股票類型', '商品代碼', '部位占比'])],
+    'daily_position_changes': [('changes', ['商品代碼', '數量變化'])],
+    'combined_holdings_and_changes': [('max_holdings', ['股票類型', '商品代碼', '部位占比']),
+                                      ('changes', ['商品代碼', '數量變化'])],
+    'allocation_history': [('allocation', None)],
+    'unrealized_pnl_history': [('summary', ['未實現損益'])],
+    'daily_value_change': [('summary', ['每日變化'])],
+    'drawdown_history': [('summary', ['回撤', '最大回撤'])],
+}
+
+
+# 今日部位變化面板最多顯示的筆數
+TOP_CHANGES = 10
+
+# 繪圖快取的總大小上限 (MB) 及最久保留天數，超過時依最後使用時間刪除較舊的圖片
+RENDER_CACHE_MAX_MB = float(os.getenv('RENDER_CACHE_MAX_MB', 512))
+RENDER_CACHE_MAX_DAYS = float(os.getenv('RENDER_CACHE_MAX_DAYS', 30))
+
+
+def _frame_digest(frame):
+    digest = hashlib.sha256()
+    digest.update(json.dumps([list(map(str, frame.columns)), list(map(str, frame.dtypes))],
+                             ensure_ascii=False).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(frame, index=True).values.tobytes())
+    return digest.hexdigest()
+
+
+def prune_render_cache(cache_dir, max_bytes=None, max_age=None):
+    """
+    刪除超過 max_age 秒未使用的快取圖片，總大小超過 max_bytes 時再由最久未使用的圖片開始刪除
+
+    :return: 刪除的圖片數量
+    """
+    max_bytes = RENDER_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+    max_age = RENDER_CACHE_MAX_DAYS * 86400 if max_age is None else max_age
+    entries = []
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    expired_before = time.time() - max_age
+    removed = 0
+    for mtime, size, path in entries:
+        if mtime >= expired_before and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # 其他繪圖行程已刪除
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def _link_or_copy(src, dst):
+    # 優先使用硬連結，不支援時 (例如跨檔案系統) 改為複製
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return
+    tmp_path = f'{dst}.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+class PositionFigure:
+    def __init__(self, positions_table: pd.DataFrame, render_cache_dir=None, series=None, stale_note=None):
+        """
+        :param positions_table: 持倉表 (list_positions_detail 的結果)
+        :param series: PortfolioSeries.read() 取得的 (allocation, summary)，提供時才能繪製歷史走勢圖
+        :param render_cache_dir: 已繪製圖片的快取目錄，以圖表資料、布局、DPI 及格式的指紋為檔名；
+                                 指紋相同時直接連結先前的圖片而不重新繪製，None 表示不使用快取
+        :param stale_note: 資料並非最新時的說明文字，會標示於組合圖上方
+        """
+        self.positions = positions_table
+        self.render_cache_dir = render_cache_dir
+        self.series = series
+        self.stale_note = stale_note
+        self._aggregates = None
+        self._chart_fingerprints = {}
+        _apply_theme()
+        self.plt = plt
         self.color_palette = sns.color_palette("husl", 8)
 
+    def set_positions(self, positions_table: pd.DataFrame):
+        """
+        更換持倉表，並清除已計算的彙總資料
+        """
+        self.positions = positions_table
+        self.invalidate()
+
+    def invalidate(self):
+        self._aggregates = None
+        self._chart_fingerprints = {}
+
+    @property
+    def aggregates(self):
+        """
+        各圖表共用的彙總資料，只在第一次使用時計算一次，持倉表不會被修改
+
+        - by_type: 各股票類型的部位價值、部位占比、數量及損益
+        - max_holdings: 各股票類型部位價值最大的持倉
+        - changes: 今日數量有變化的持倉 (含數量變化、變化類型欄位)
+        - top_changes: changes 中變化絕對值最大的 TOP_CHANGES 筆，依變化絕對值排序
+        - allocation、summary: 提供 series 時的歷史時間序列
+        """
+        if self._aggregates is None:
+            grouped = self.positions.groupby('股票類型', observed=True)
+            by_type = grouped.agg({'部位價值': 'sum', '部位占比': 'sum', '數量': 'sum', '損益': 'sum'})
+            max_holdings = self.positions.loc[grouped['部位價值'].idxmax()]
+            quantity_changes = self.positions['數量'] - self.positions['昨日庫存數量']
+            changes = self.positions[quantity_changes != 0].assign(數量變化=quantity_changes[quantity_changes != 0])
+            changes['變化類型'] = np.where(changes['數量變化'] > 0, '增加', '減少')
+            # 面板只顯示前幾筆，以 nlargest 選出即可，不需排序全部的變化
+            top_changes = changes.loc[changes['數量變化'].abs().nlargest(TOP_CHANGES).index]
+            self._aggregates = {'by_type': by_type, 'max_holdings': max_holdings, 'changes': changes,
+                                'top_changes': top_changes}
+            if self.series is not None:
+                self._aggregates['allocation'], self._aggregates['summary'] = self.series
+        return self._aggregates
+
+    @classmethod
+    def _code_version(cls):
+        # 繪圖程式碼本身也納入指紋，修改圖表樣式後不會沿用舊圖
+        if '_code_digest' not in cls.__dict__:
+            cls._code_digest = hashlib.sha256(inspect.getsource(cls).encode('utf-8')).hexdigest()
+        return cls._code_digest
+
+    def chart_fingerprint(self, method_name):
+        """
+        計算單一圖表方法輸入資料的指紋，只包含該圖表實際使用的彙總欄位
+        """
+        if method_name not in self._chart_fingerprints:
+            if method_name in CHART_INPUTS:
+                parts = [_frame_digest(self.aggregates[key] if columns is None else self.aggregates[key][columns])
+                         for key, columns in CHART_INPUTS[method_name]]
+            else:
+                parts = [_frame_digest(self.positions)]
+            self._chart_fingerprints[method_name] = hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+        return self._chart_fingerprints[method_name]
+
+    def render_fingerprint(self, chart_configs, dpi, format):
+        """
+        計算一張輸出圖片的指紋：各圖表的資料指紋、布局、DPI、格式及繪圖環境
+        """
+        layout = [[method_name, list(position), list(size)] for method_name, position, size in chart_configs]
+        key = {
+            'code': self._code_version(),
+            'matplotlib': matplotlib.__version__,
+            'font': list(plt.rcParams['font.sans-serif']),
+            'layout': layout,
+            'charts': [self.chart_fingerprint(method_name) for method_name, _, _ in chart_configs],
+            'dpi': dpi,
+            'format': format,
+            'stale_note': self.stale_note,
+        }
+        return hashlib.sha256(json.dumps(key, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _cached_render_path(self, fingerprint, format):
+        return os.path.join(self.render_cache_dir, f'{fingerprint}.{format}')
+
+    def reuse_rendered(self, fingerprint, file_path, format):
+        """
+        快取中已有相同指紋的圖片時，連結至 file_path 並回傳 True
+        """
+        if not self.render_cache_dir:
+            return False
+        cached_path = self._cached_render_path(fingerprint, format)
+        hit = os.path.exists(cached_path)
+        if hit:
+            try:
+                # 更新最後使用時間，快取超過上限時依此淘汰
+                os.utime(cached_path)
+                _link_or_copy(cached_path, file_path)
+            except FileNotFoundError:
+                # 剛好被淘汰
+                hit = False
+        metrics.cache('render', format, hit)
+        if hit:
+            print(f"圖表資料未變更，沿用先前的圖片: {file_path}")
+        return hit
+
+    def _detach_output(self, file_path):
+        # 輸出檔可能是快取圖片的硬連結，先移除再寫入，避免覆寫到快取中的舊圖
+        if self.render_cache_dir and os.path.exists(file_path):
+            os.remove(file_path)
+
+    def store_rendered(self, fingerprint, file_path, format):
+        if not self.render_cache_dir:
+            return
+        os.makedirs(self.render_cache_dir, exist_ok=True)
+        _link_or_copy(file_path, self._cached_render_path(fingerprint, format))
+        prune_render_cache(self.render_cache_dir)
+
+    @staticmethod
+    def _draw_row_separators(ax, top, row_height, num_rows, linewidth=0.8):
+        # 各列之間的分隔線以單一 LineCollection 繪製
+        if num_rows < 2:
+            return
+        ys = top - np.arange(1, num_rows) * row_height
+        segments = np.stack([np.column_stack([np.full_like(ys, 0.05), ys]),
+                             np.column_stack([np.full_like(ys, 0.95), ys])], axis=1)
+        ax.add_collection(LineCollection(segments, colors='lightgray', linestyles='--', linewidths=linewidth,
+                                         transform=ax.transAxes), autolim=False)
+
+    def _draw_holding_rows(self, ax, top, row_height, fontsize):
+        max_holdings = self.aggregates['max_holdings']
+        colors = plt.cm.tab10(np.linspace(0, 1, len(max_holdings)))  # 為每種股票類型生成不同的顏色
+        rows = zip(max_holdings['股票類型'], max_holdings['商品代碼'], max_holdings['部位占比'])
+        for i, (stock_type, code, ratio) in enumerate(rows):
+            y_pos = top - (i + 0.5) * row_height  # 調整垂直位置，使文字居中
+            ax.text(0.05, y_pos, f"{stock_type}:", fontsize=fontsize, fontweight='bold', color=colors[i],
+                    transform=ax.transAxes, va='center')
+            ax.text(0.5, y_pos, f"{code}", fontsize=fontsize, transform=ax.transAxes, ha='center', va='center')
+            ax.text(0.95, y_pos, f"({ratio:,.2f}%)", fontsize=fontsize, color='#555555',
+                    transform=ax.transAxes, ha='right', va='center')
+        self._draw_row_separators(ax, top, row_height, len(max_holdings))
+
+    def _draw_change_rows(self, ax, top, row_height, num_rows, fontsize):
+        changes = self.aggregates['top_changes'].head(num_rows)
+        # 顏色依全部變化筆數漸層，只計算顯示的前幾筆
+        total = len(self.aggregates['changes'])
+        colors = plt.cm.RdYlGn(np.arange(len(changes)) / max(total - 1, 1))
+        for i, (code, change) in enumerate(zip(changes['商品代碼'], changes['數量變化'])):
+            y_pos = top - (i + 0.5) * row_height
+            ax.text(0.05, y_pos, f"{code}:", fontsize=fontsize, fontweight='bold', color=colors[i],
+                    transform=ax.transAxes, va='center')
+            ax.text(0.6, y_pos, '增加' if change > 0 else '減少', fontsize=fontsize, transform=ax.transAxes,
+                    ha='center', va='center', color='green' if change > 0 else 'red')
+            ax.text(0.95, y_pos, f"{abs(change):,.0f} 股", fontsize=fontsize, color='#555555',
+                    transform=ax.transAxes, ha='right', va='center')
+        self._draw_row_separators(ax, top, row_height, num_rows)
+
     def position_pie(self, ax):
-        position_type = self.positions.groupby('股票類型').agg({'部位價值': 'sum', '部位占比': 'sum', '數量': 'sum'})
+        position_type = self.aggregates['by_type']
         position_type_index = [i + f'\n({position_type["數量"][i]:,})' for i in position_type.index]
         colors = self.color_palette[:len(position_type)]
         wedges, texts, autotexts = ax.pie(position_type['部位占比'],
@@ -37,7 +313,7 @@ class PositionFigure:
         plt.setp(autotexts, size=9, weight="bold")
 
     def loss_bar_with_type(self, ax):
-        position_type = self.positions.groupby('股票類型').agg({'損益': 'sum'}).sort_values('損益')
+        position_type = self.aggregates['by_type'][['損益']].sort_values('損益')
         colors = [self.color_palette[0] if x >= 0 else self.color_palette[2] for x in position_type['損益']]
         bars = ax.barh(position_type.index, position_type['損益'], color=colors, alpha=0.8)
 
@@ -68,8 +344,7 @@ class PositionFigure:
         sns.despine(left=True, bottom=True, ax=ax)
 
     def value_bar_chart(self, ax):
-        position_type = self.positions.groupby('股票類型').agg({'部位價值': 'sum'}).sort_values('部位價值',
-                                                                                                ascending=False)
+        position_type = self.aggregates['by_type'][['部位價值']].sort_values('部位價值', ascending=False)
         colors = sns.color_palette("Blues_d", len(position_type))
         bars = ax.bar(position_type.index, position_type['部位價值'], color=colors)
 
@@ -91,8 +366,77 @@ class PositionFigure:
 
         sns.despine(ax=ax)
 
+    def allocation_history(self, ax):
+        """
+        各股票類型部位占比的歷史走勢 (堆疊面積圖)
+        """
+        allocation = self.aggregates['allocation']
+        values = allocation.to_numpy()
+        totals = values.sum(axis=1, keepdims=True)
+        shares = np.divide(values, totals, out=np.zeros_like(values), where=totals > 0) * 100
+        ax.stackplot(allocation.index, shares.T, labels=list(allocation.columns),
+                     colors=self.color_palette[:len(allocation.columns)], alpha=0.85)
+        ax.set_ylim(0, 100)
+        ax.set_ylabel('部位占比 (%)', fontsize=12, fontweight='bold')
+        ax.set_title('各股票類型配置變化', fontsize=14, fontweight='bold', pad=20)
+        ax.legend(loc='upper left', fontsize=8, framealpha=0.7)
+        ax.tick_params(axis='x', labelsize=9, rotation=30)
+        sns.despine(ax=ax)
+
+    def unrealized_pnl_history(self, ax):
+        """
+        未實現損益的歷史走勢
+        """
+        pnl = self.aggregates['summary']['未實現損益']
+        values = pnl.to_numpy()
+        ax.plot(pnl.index, values, color='#333333', linewidth=1.2)
+        ax.fill_between(pnl.index, values, 0, where=values >= 0, color=self.color_palette[0], alpha=0.4,
+                        interpolate=True)
+        ax.fill_between(pnl.index, values, 0, where=values < 0, color=self.color_palette[2], alpha=0.4,
+                        interpolate=True)
+        ax.axhline(y=0, color='gray', linestyle='--', linewidth=1)
+        ax.set_ylabel('未實現損益', fontsize=12, fontweight='bold')
+        ax.set_title('未實現損益走勢', fontsize=14, fontweight='bold', pad=20)
+        ax.tick_params(axis='x', labelsize=9, rotation=30)
+        ax.yaxis.grid(True, linestyle='--', alpha=0.7)
+        sns.despine(ax=ax)
+
+    def daily_value_change(self, ax):
+        """
+        每日部位價值變化
+        """
+        change = self.aggregates['summary']['每日變化'].dropna()
+        values = change.to_numpy()
+        colors = [self.color_palette[0] if x >= 0 else self.color_palette[2] for x in values]
+        ax.bar(change.index, values, color=colors, width=0.8, linewidth=0)
+        ax.axhline(y=0, color='gray', linestyle='--', linewidth=1)
+        ax.set_ylabel('價值變化', fontsize=12, fontweight='bold')
+        ax.set_title('每日部位價值變化', fontsize=14, fontweight='bold', pad=20)
+        ax.tick_params(axis='x', labelsize=9, rotation=30)
+        ax.yaxis.grid(True, linestyle='--', alpha=0.7)
+        sns.despine(ax=ax)
+
+    def drawdown_history(self, ax):
+        """
+        部位價值相對歷史高點的回撤及最大回撤
+        """
+        summary = self.aggregates['summary']
+        drawdown = summary['回撤'].to_numpy() * 100
+        ax.fill_between(summary.index, drawdown, 0, color=self.color_palette[2], alpha=0.4)
+        ax.plot(summary.index, drawdown, color=self.color_palette[2], linewidth=1)
+        if len(summary):
+            max_drawdown = summary['最大回撤'].iloc[-1] * 100
+            ax.axhline(y=max_drawdown, color='gray', linestyle='--', linewidth=1)
+            ax.text(0.98, 0.05, f'最大回撤 {max_drawdown:.2f}%', transform=ax.transAxes, ha='right', va='bottom',
+                    fontsize=10, fontweight='bold', bbox=dict(facecolor='white', edgecolor='none', alpha=0.7))
+        ax.set_ylabel('回撤 (%)', fontsize=12, fontweight='bold')
+        ax.set_title('部位價值回撤', fontsize=14, fontweight='bold', pad=20)
+        ax.tick_params(axis='x', labelsize=9, rotation=30)
+        ax.yaxis.grid(True, linestyle='--', alpha=0.7)
+        sns.despine(ax=ax)
+
     def max_holdings_text(self, ax):
-        max_holdings = self.positions.loc[self.positions.groupby('股票類型')['部位價值'].idxmax()]
+        max_holdings = self.aggregates['max_holdings']
 
         ax.set_facecolor('white')  # 設置白色背景
 
@@ -101,31 +445,8 @@ class PositionFigure:
                 ha='center', va='top', fontsize=14, fontweight='bold',
                 transform=ax.transAxes)
 
-        colors = plt.cm.tab10(np.linspace(0, 1, len(max_holdings)))  # 為每種股票類型生成不同的顏色
-
-        num_rows = len(max_holdings)
-        row_height = 0.7 / num_rows  # 調整行高
-
-        for i, (_, row) in enumerate(max_holdings.iterrows()):
-            y_pos = 0.85 - (i + 0.5) * row_height  # 調整垂直位置，使文字居中
-
-            # 股票類型
-            ax.text(0.05, y_pos, f"{row['股票類型']}:",
-                    fontsize=12, fontweight='bold', color=colors[i],
-                    transform=ax.transAxes, va='center')
-
-            # 商品代碼
-            ax.text(0.5, y_pos, f"{row['商品代碼']}",
-                    fontsize=12, transform=ax.transAxes, ha='center', va='center')
-
-            # 佔比
-            ax.text(0.95, y_pos, f"({row['部位占比']:,.2f}%)",
-                    fontsize=12, color='#555555', transform=ax.transAxes, ha='right', va='center')
-
-            # 添加分隔線
-            if i < num_rows - 1:  # 不在最後一行下方添加分隔線
-                ax.axhline(y=0.85 - (i + 1) * row_height, xmin=0.05, xmax=0.95,
-                           color='lightgray', linestyle='--', linewidth=0.8)
+        row_height = 0.7 / len(max_holdings)  # 調整行高
+        self._draw_holding_rows(ax, top=0.85, row_height=row_height, fontsize=12)
 
         # # 添加外框
         # ax.add_patch(plt.Rectangle((0.02, 0.1), 0.96, 0.82, fill=False,
@@ -140,15 +461,7 @@ class PositionFigure:
         """
         顯示今日增加或減少的部位信息，使用更美觀的排版
         """
-        # 計算數量變化
-        self.positions['數量變化'] = self.positions['數量'] - self.positions['昨日庫存數量']
-
-        # 篩選出有變化的部位
-        changed_positions = self.positions[self.positions['數量變化'] != 0].copy()
-        changed_positions['變化類型'] = changed_positions['數量變化'].apply(lambda x: '增加' if x > 0 else '減少')
-
-        # 按變化絕對值排序
-        changed_positions = changed_positions.sort_values(by='數量變化', key=abs, ascending=False)
+        changed_positions = self.aggregates['changes']
 
         ax.set_facecolor('white')  # 設置白色背景
 
@@ -157,36 +470,9 @@ class PositionFigure:
                 ha='center', va='top', fontsize=14, fontweight='bold',
                 transform=ax.transAxes)
 
-        colors = plt.cm.RdYlGn(np.linspace(0, 1, len(changed_positions)))  # 為每個變化生成顏色
-
-        num_rows = min(len(changed_positions), 10)  # 限制顯示的行數
-        row_height = 0.7 / num_rows  # 調整行高
-
-        for i, (_, row) in enumerate(changed_positions.iterrows()):
-            if i >= num_rows:
-                break
-
-            y_pos = 0.85 - (i + 0.5) * row_height  # 調整垂直位置，使文字居中
-
-            # 商品代碼和名稱
-            ax.text(0.05, y_pos, f"{row['商品代碼']}:",
-                    fontsize=11, fontweight='bold', color=colors[i],
-                    transform=ax.transAxes, va='center')
-
-            # 變化類型
-            change_type = '增加' if row['數量變化'] > 0 else '減少'
-            ax.text(0.6, y_pos, change_type,
-                    fontsize=11, transform=ax.transAxes, ha='center', va='center',
-                    color='green' if change_type == '增加' else 'red')
-
-            # 變化數量
-            ax.text(0.95, y_pos, f"{abs(row['數量變化']):,.0f} 股",
-                    fontsize=11, color='#555555', transform=ax.transAxes, ha='right', va='center')
-
-            # 添加分隔線
-            if i < num_rows - 1:  # 不在最後一行下方添加分隔線
-                ax.axhline(y=0.85 - (i + 1) * row_height, xmin=0.05, xmax=0.95,
-                           color='lightgray', linestyle='--', linewidth=0.8)
+        num_rows = min(len(changed_positions), TOP_CHANGES)  # 限制顯示的行數
+        if num_rows:
+            self._draw_change_rows(ax, top=0.85, row_height=0.7 / num_rows, num_rows=num_rows, fontsize=11)
 
         if changed_positions.empty:
             ax.text(0.5, 0.5, "今日無部位變化",
@@ -197,6 +483,7 @@ class PositionFigure:
         ax.set_ylim(0, 1)
         ax.axis('off')
 
+    @_with_pyplot_lock
     def custom_combined_charts(self, chart_configs, save_path=None, dpi=300, format='jpg'):
         """
         自定義組合圖表並保存到指定路徑
@@ -207,29 +494,105 @@ class PositionFigure:
         :param dpi: 圖片的 DPI (dots per inch)
         :param format: 圖片格式，例如 'png', 'pdf', 'svg' 等
         """
-        total_rows = max(config[1][0] for config in chart_configs) + 1
-        total_cols = max(config[1][1] for config in chart_configs) + 1
-
-        fig = plt.figure(figsize=(6 * total_cols, 5 * total_rows))
-
-        for method_name, position, size in chart_configs:
-            ax = plt.subplot2grid((total_rows, total_cols), position, colspan=size[1], rowspan=size[0])
-            method = getattr(self, method_name)
-            method(ax)
+        fingerprint = None
+        if save_path and self.render_cache_dir:
+            fingerprint = self.render_fingerprint(chart_configs, dpi, format)
+            if self.reuse_rendered(fingerprint, save_path, format):
+                return save_path
 
-        plt.tight_layout()
+        fig = self._draw_combined(chart_configs)
         # plt.suptitle('股票投資組合分析', fontsize=16, fontweight='bold', y=1.02)
         # plt.show()
         if save_path:
             # 確保保存路徑的目錄存在
             os.makedirs(os.path.dirname(save_path), exist_ok=True)
             # 保存圖片
-            plt.savefig(save_path, dpi=dpi, format=format, bbox_inches='tight')
+            self._detach_output(save_path)
+            with metrics.timer('render', f'savefig.{format}'):
+                plt.savefig(save_path, dpi=dpi, format=format, bbox_inches='tight')
             plt.close(fig)  # 關閉圖形以釋放內存
             print(f"圖片已保存至: {save_path}")
+            if fingerprint:
+                self.store_rendered(fingerprint, save_path, format)
+            return save_path
         else:
             plt.show()
 
+    def _draw_combined(self, chart_configs):
+        total_rows = max(config[1][0] for config in chart_configs) + 1
+        total_cols = max(config[1][1] for config in chart_configs) + 1
+
+        fig = plt.figure(figsize=(6 * total_cols, 5 * total_rows))
+
+        for method_name, position, size in chart_configs:
+            ax = plt.subplot2grid((total_rows, total_cols), position, colspan=size[1], rowspan=size[0])
+            method = getattr(self, method_name)
+            with metrics.timer('render', method_name):
+                method(ax)
+
+        if self.stale_note:
+            fig.suptitle(f'資料並非最新：{self.stale_note}', color='red', fontsize=14)
+        plt.tight_layout()
+        return fig
+
+    def publish(self, chart_configs, outputs, dpi=300):
+        """
+        組合圖表只繪製一次至 Agg 的 RGBA 緩衝區，再於背景執行緒中同時編碼成多種格式及尺寸
+
+        :param chart_configs: 與 custom_combined_charts 相同
+        :param outputs: 列表，每個元素為 dict，包含 path、format (例如 'jpg'、'png'、'webp')，
+                        可選擇性指定 max_size (最長邊像素，用於縮圖) 及 PIL 的編碼參數 (例如 quality)
+        :param dpi: 繪製的 DPI
+        :return: 各輸出的 Future，結果為輸出的檔案路徑
+        """
+        outputs = [dict(output) for output in outputs]
+        fingerprint = self.render_fingerprint(chart_configs, dpi, 'rgba') if self.render_cache_dir else None
+        pending = []
+        futures = {}
+        for output in outputs:
+            os.makedirs(os.path.dirname(os.path.abspath(output['path'])), exist_ok=True)
+            if fingerprint:
+                output['fingerprint'] = hashlib.sha256(
+                    json.dumps([fingerprint, {k: v for k, v in output.items() if k != 'path'}],
+                               sort_keys=True).encode('utf-8')).hexdigest()
+                if self.reuse_rendered(output['fingerprint'], output['path'], output['format']):
+                    future = Future()
+                    future.set_result(output['path'])
+                    futures[id(output)] = future
+                    continue
+            pending.append(output)
+
+        if pending:
+            rgba = self.rasterize(chart_configs, dpi)
+            for output in pending:
+                futures[id(output)] = _encoder().submit(self._encode_output, rgba, output, dpi)
+        return [futures[id(output)] for output in outputs]
+
+    @_with_pyplot_lock
+    def rasterize(self, chart_configs, dpi=300):
+        """
+        繪製組合圖表並回傳與 savefig(bbox_inches='tight') 相同的 RGBA 陣列；超出圖形範圍的標題或標籤
+        會與 savefig 一樣擴大畫布，不會被裁掉
+        """
+        fig = self._draw_combined(chart_configs)
+        with metrics.timer('render', 'rasterize'):
+            # 經由 savefig 的 tight bbox 流程只繪製一次，輸出未壓縮的 RGBA 位元組
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format='rgba', dpi=dpi, bbox_inches='tight')
+            # savefig 所用的 Agg renderer 即為裁切後的尺寸
+            shape = (int(fig.canvas.renderer.height), int(fig.canvas.renderer.width), 4)
+        plt.close(fig)
+        # 陣列直接引用 BytesIO 的內容，不另外複製
+        return np.frombuffer(buffer.getbuffer(), dtype=np.uint8).reshape(shape)
+
+    def _encode_output(self, rgba, output, dpi):
+        path = encode_image(rgba, output['path'], output['format'], dpi=dpi, max_size=output.get('max_size'),
+                            **{k: v for k, v in output.items() if k not in ('path', 'format', 'max_size', 'fingerprint')})
+        print(f"圖片已保存至: {path}")
+        if output.get('fingerprint'):
+            self.store_rendered(output['fingerprint'], path, output['format'])
+        return path
+
     def combined_holdings_and_changes(self, ax):
         """
         合併顯示最大持倉和每日變化信息
@@ -249,77 +612,33 @@ class PositionFigure:
         ax.axhline(y=0.5, xmin=0.02, xmax=0.98, color='gray', linestyle='-', linewidth=0.5)
 
     def draw_max_holdings(self, ax, top, bottom):
-        max_holdings = self.positions.loc[self.positions.groupby('股票類型')['部位價值'].idxmax()]
+        max_holdings = self.aggregates['max_holdings']
 
         ax.text(0.5, top - 0.05, "各類型股票最大持倉",
                 ha='center', va='top', fontsize=12, fontweight='bold',
                 transform=ax.transAxes)
 
-        colors = plt.cm.tab10(np.linspace(0, 1, len(max_holdings)))
-        num_rows = len(max_holdings)
-        row_height = (top - bottom - 0.1) / num_rows
-
-        for i, (_, row) in enumerate(max_holdings.iterrows()):
-            y_pos = top - 0.1 - (i + 0.5) * row_height
-
-            ax.text(0.05, y_pos, f"{row['股票類型']}:",
-                    fontsize=10, fontweight='bold', color=colors[i],
-                    transform=ax.transAxes, va='center')
-
-            ax.text(0.5, y_pos, f"{row['商品代碼']}",
-                    fontsize=10, transform=ax.transAxes, ha='center', va='center')
-
-            ax.text(0.95, y_pos, f"({row['部位占比']:,.2f}%)",
-                    fontsize=10, color='#555555', transform=ax.transAxes, ha='right', va='center')
-
-            if i < num_rows - 1:
-                ax.axhline(y=top - 0.1 - (i + 1) * row_height, xmin=0.05, xmax=0.95,
-                           color='lightgray', linestyle='--', linewidth=0.8)
+        row_height = (top - bottom - 0.1) / len(max_holdings)
+        self._draw_holding_rows(ax, top=top - 0.1, row_height=row_height, fontsize=10)
 
     def draw_daily_changes(self, ax, top, bottom):
-        self.positions['數量變化'] = self.positions['數量'] - self.positions['昨日庫存數量']
-        changed_positions = self.positions[self.positions['數量變化'] != 0].copy()
-        changed_positions['變化類型'] = changed_positions['數量變化'].apply(lambda x: '增加' if x > 0 else '減少')
-        changed_positions = changed_positions.sort_values(by='數量變化', key=abs, ascending=False)
+        changed_positions = self.aggregates['changes']
 
         ax.text(0.5, top - 0.05, "今日部位變化",
                 ha='center', va='top', fontsize=12, fontweight='bold',
                 transform=ax.transAxes)
 
-        colors = plt.cm.RdYlGn(np.linspace(0, 1, len(changed_positions)))
         num_rows = min(len(changed_positions), 5)  # 限制顯示的行數
-        if num_rows == 0:
-            num_rows = 1
-        row_height = (top - bottom - 0.1) / num_rows
-
-        for i, (_, row) in enumerate(changed_positions.iterrows()):
-            if i >= num_rows:
-                break
-
-            y_pos = top - 0.1 - (i + 0.5) * row_height
-
-            ax.text(0.05, y_pos, f"{row['商品代碼']}:",
-                    fontsize=9, fontweight='bold', color=colors[i],
-                    transform=ax.transAxes, va='center')
-
-            change_type = '增加' if row['數量變化'] > 0 else '減少'
-            ax.text(0.6, y_pos, change_type,
-                    fontsize=9, transform=ax.transAxes, ha='center', va='center',
-                    color='green' if change_type == '增加' else 'red')
-
-            ax.text(0.95, y_pos, f"{abs(row['數量變化']):,.0f} 股",
-                    fontsize=9, color='#555555', transform=ax.transAxes, ha='right', va='center')
-
-            if i < num_rows - 1:
-                ax.axhline(y=top - 0.1 - (i + 1) * row_height, xmin=0.05, xmax=0.95,
-                           color='lightgray', linestyle='--', linewidth=0.8)
+        if num_rows:
+            self._draw_change_rows(ax, top=top - 0.1, row_height=(top - bottom - 0.1) / num_rows, num_rows=num_rows,
+                                   fontsize=9)
 
         if changed_positions.empty:
             ax.text(0.5, (top + bottom) / 2, "今日無部位變化",
                     ha='center', va='center', fontsize=10,
                     transform=ax.transAxes)
 
-    def save_individual_charts(self, chart_configs, save_dir, dpi=300, format='jpg'):
+    def save_individual_charts(self, chart_configs, save_dir, dpi=300, format='jpg', processes=None):
         """
         根據 chart_configs 生成多個單獨的圖表並保存到指定目錄
 
@@ -328,30 +647,137 @@ class PositionFigure:
         :param save_dir: 保存圖片的目錄路徑
         :param dpi: 圖片的 DPI (dots per inch)
         :param format: 圖片格式，例如 'png', 'pdf', 'svg' 等
+        :param processes: 平行繪圖的行程數，None 表示在目前行程中依序繪製
         """
         # 確保保存目錄存在
         os.makedirs(save_dir, exist_ok=True)
 
-        for i, (method_name, _, _) in enumerate(chart_configs):
-            # 創建新的圖表
-            fig, ax = plt.subplots(figsize=(8, 6))
+        jobs = [('save_chart', dict(method_name=method_name,
+                                    file_path=os.path.join(save_dir, f"{method_name}.{format}"),
+                                    dpi=dpi, format=format))
+                for method_name, _, _ in chart_configs]
+        return self.render_batch(jobs, processes=processes)
 
-            # 調用對應的方法繪製圖表
-            method = getattr(self, method_name)
+    @_with_pyplot_lock
+    def save_chart(self, method_name, file_path, dpi=300, format='jpg'):
+        """
+        將單一圖表方法繪製成獨立圖片，圖表資料未變更時沿用快取中的圖片
+        """
+        fingerprint = None
+        if self.render_cache_dir:
+            fingerprint = self.render_fingerprint([[method_name, (0, 0), (1, 1)]], dpi, format)
+            if self.reuse_rendered(fingerprint, file_path, format):
+                return file_path
+
+        # 創建新的圖表
+        fig, ax = plt.subplots(figsize=(8, 6))
+
+        # 調用對應的方法繪製圖表
+        method = getattr(self, method_name)
+        with metrics.timer('render', method_name):
             method(ax)
 
-            # 設置標題
-            # plt.title(method_name.replace('_', ' ').title(), fontsize=16, fontweight='bold')
+        # 設置標題
+        # plt.title(method_name.replace('_', ' ').title(), fontsize=16, fontweight='bold')
 
-            # 調整布局
-            plt.tight_layout()
-
-            # 生成文件名
-            file_name = f"{method_name}.{format}"
-            file_path = os.path.join(save_dir, file_name)
+        # 調整布局
+        plt.tight_layout()
 
-            # 保存圖片
+        # 保存圖片
+        self._detach_output(file_path)
+        with metrics.timer('render', f'savefig.{format}'):
             plt.savefig(file_path, dpi=dpi, format=format, bbox_inches='tight')
-            plt.close(fig)  # 關閉圖形以釋放內存
+        plt.close(fig)  # 關閉圖形以釋放內存
 
-            print(f"圖片已保存至: {file_path}")
\ No newline at end of file
+        print(f"圖片已保存至: {file_path}")
+        if fingerprint:
+            self.store_rendered(fingerprint, file_path, format)
+        return file_path
+
+    def render_batch(self, jobs, processes=None):
+        """
+        批次輸出多張互相獨立的圖片 (單獨圖表、多種布局或多種格式)
+
+        :param jobs: 列表，每個元素為 (方法名稱, 參數字典)，例如
+                     ('save_chart', {'method_name': 'position_pie', 'file_path': 'pie.png'}) 或
+                     ('custom_combined_charts', {'chart_configs': ..., 'save_path': 'summary.jpg'})
+        :param processes: 平行繪圖的行程數，None 表示在目前行程中依序繪製；
+                          各行程啟動時只會設定一次字型與 seaborn 主題
+        :return: 各工作的回傳值，順序與 jobs 相同
+        """
+        if not processes or processes <= 1 or len(jobs) <= 1:
+            return [getattr(self, method_name)(**kwargs) for method_name, kwargs in jobs]
+
+        with ProcessPoolExecutor(max_workers=min(processes, len(jobs)),
+                                 mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_render_worker,
+                                 initargs=(self.positions, self.render_cache_dir, self.series)) as executor:
+            return list(executor.map(_render_job, jobs))
+
+
+# PIL 的格式名稱
+PIL_FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP'}
+_encoder_pool = None
+_encoder_lock = threading.Lock()
+
+
+def _encoder():
+    # 背景編碼用的執行緒池，PIL 編碼時會釋放 GIL，多種格式可同時進行
+    global _encoder_pool
+    with _encoder_lock:
+        if _encoder_pool is None:
+            _encoder_pool = ThreadPoolExecutor(max_workers=int(os.getenv('ENCODE_WORKERS', 3)),
+                                               thread_name_prefix='encode')
+        return _encoder_pool
+
+
+def _to_image(rgba, format, dpi=None, max_size=None, options=None):
+    from PIL import Image
+    image = Image.fromarray(rgba, 'RGBA').convert('RGB')
+    if max_size:
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+    options = dict(options or {})
+    if dpi and format.lower() != 'webp':
+        options.setdefault('dpi', (dpi, dpi))
+    return image, PIL_FORMATS.get(format.lower(), format.upper()), options
+
+
+def encode_image(rgba, path, format, dpi=None, max_size=None, **options):
+    """
+    將 RGBA 陣列編碼為圖片檔
+
+    :param max_size: 最長邊的像素上限，超過時等比例縮小
+    :param options: PIL 的編碼參數，例如 quality
+    """
+    with metrics.timer('render', f'encode.{format}'):
+        image, pil_format, options = _to_image(rgba, format, dpi, max_size, options)
+        tmp_path = f'{path}.tmp'
+        image.save(tmp_path, format=pil_format, **options)
+        os.replace(tmp_path, path)
+    return path
+
+
+def encode_bytes(rgba, format, dpi=None, max_size=None, **options):
+    """
+    將 RGBA 陣列編碼為圖片的位元組內容，參數與 encode_image 相同
+    """
+    import io
+    with metrics.timer('render', f'encode.{format}'):
+        image, pil_format, options = _to_image(rgba, format, dpi, max_size, options)
+        buffer = io.BytesIO()
+        image.save(buffer, format=pil_format, **options)
+    return buffer.getvalue()
+
+
+_worker_figure = None
+
+
+def _init_render_worker(positions_table, render_cache_dir=None, series=None):
+    # 每個繪圖行程只建立一次 PositionFigure，字型及主題設定不需在每張圖重複進行
+    global _worker_figure
+    _worker_figure = PositionFigure(positions_table, render_cache_dir=render_cache_dir, series=series)
+
+
+def _render_job(job):
+    method_name, kwargs = job
+    return getattr(_worker_figure, method_name)(**kwargs)
@@ -0,0 +1,311 @@
+import os
+import re
+import sqlite3
+import sys
+from contextlib import closing
+from datetime import datetime
+from glob import glob
+from PositionSchema import apply_schema, read_positions_csv
+
+
+class PositionHistory:
+    """
+    以 SQLite 保存每日持倉快照，欄位具型別並以日期建立索引，讀取時只會掃描指定日期區間
+    """
+    columns = {
+        '部位代碼': 'INTEGER',
+        '商品代碼': 'TEXT',
+        '數量': 'INTEGER',
+        '平均價格': 'REAL',
+        '目前股價': 'REAL',
+        '損益': 'REAL',
+        '昨日庫存數量': 'INTEGER',
+        '商品類型': 'TEXT',
+        '股票類型': 'TEXT',
+        '部位價值': 'REAL',
+        '部位占比': 'REAL',
+    }
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self.connect()) as conn, conn:
+            column_defs = ', '.join(f'"{name}" {sql_type}' for name, sql_type in self.columns.items())
+            conn.execute(f'CREATE TABLE IF NOT EXISTS positions ("日期" INTEGER NOT NULL, {column_defs})')
+            conn.execute('CREATE INDEX IF NOT EXISTS positions_date ON positions ("日期")')
+            # 每次寫入某日快照時遞增該日的版本，時間序列據此判斷哪些日期被覆寫 (例如重新匯入舊的 CSV)
+            conn.execute('CREATE TABLE IF NOT EXISTS snapshot_versions ("日期" INTEGER PRIMARY KEY, "版本" INTEGER NOT NULL)')
+            conn.execute('INSERT OR IGNORE INTO snapshot_versions SELECT DISTINCT "日期", 1 FROM positions')
+
+    def connect(self):
+        return sqlite3.connect(self.path)
+
+    @staticmethod
+    def date_key(date):
+        if date is None:
+            return None
+        if isinstance(date, str):
+            date = datetime.strptime(date.replace('-', ''), '%Y%m%d')
+        return int(date.strftime('%Y%m%d'))
+
+    def append(self, positions, date=None):
+        """
+        寫入某日的持倉快照，同一天重複寫入時會覆蓋該日資料
+
+        :param positions: list_positions_detail 取得的持倉表
+        :param date: 快照日期，預設為今天
+        """
+        import pandas as pd
+        date = self.date_key(date or datetime.now())
+        snapshot = positions.reindex(columns=list(self.columns))
+        for name, sql_type in self.columns.items():
+            if sql_type == 'TEXT':
+                snapshot[name] = snapshot[name].map(lambda v: None if pd.isna(v) else str(v))
+        snapshot.insert(0, '日期', date)
+        placeholders = ', '.join('?' for _ in snapshot.columns)
+        quoted_columns = ', '.join(f'"{name}"' for name in snapshot.columns)
+        with closing(self.connect()) as conn, conn:
+            conn.execute('DELETE FROM positions WHERE "日期" = ?', (date,))
+            conn.execute('INSERT INTO snapshot_versions VALUES (?, 1) '
+                         'ON CONFLICT ("日期") DO UPDATE SET "版本" = "版本" + 1', (date,))
+            conn.executemany(f'INSERT INTO positions ({quoted_columns}) VALUES ({placeholders})',
+                             snapshot.astype(object).where(snapshot.notna(), None).itertuples(index=False, name=None))
+
+    def read(self, start=None, end=None):
+        """
+        讀取日期區間 [start, end] 內的持倉快照
+
+        :param start: 起始日期 (含)，None 表示不限
+        :param end: 結束日期 (含)，None 表示不限
+        """
+        import pandas as pd
+        conditions, params = [], []
+        if start is not None:
+            conditions.append('"日期" >= ?')
+            params.append(self.date_key(start))
+        if end is not None:
+            conditions.append('"日期" <= ?')
+            params.append(self.date_key(end))
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        with closing(self.connect()) as conn:
+            history = pd.read_sql_query(f'SELECT * FROM positions {where} ORDER BY "日期"', conn, params=params)
+        history['日期'] = pd.to_datetime(history['日期'].astype(str), format='%Y%m%d')
+        return apply_schema(history)
+
+    def dates(self):
+        with closing(self.connect()) as conn:
+            rows = conn.execute('SELECT DISTINCT "日期" FROM positions ORDER BY "日期"').fetchall()
+        return [datetime.strptime(str(r[0]), '%Y%m%d') for r in rows]
+
+    def import_csv(self, csv_dir):
+        """
+        匯入既有的 {日期}_positions.csv 檔案
+
+        :param csv_dir: CSV 檔案所在資料夾
+        """
+        imported = 0
+        for path in sorted(glob(os.path.join(csv_dir, '*_positions.csv'))):
+            matched = re.match(r'(\d{8})_positions\.csv$', os.path.basename(path))
+            if not matched:
+                continue
+            self.append(read_positions_csv(path), date=datetime.strptime(matched.group(1), '%Y%m%d'))
+            imported += 1
+        print(f'已匯入 {imported} 個持倉檔案至 {self.path}')
+        return imported
+
+
+class PortfolioSeries:
+    """
+    由持倉歷史計算的每日時間序列 (各股票類型部位價值、未實現損益、每日價值變化、歷史高點及最大回撤)，
+    結果保存在持倉歷史資料庫中；每次 update() 只從第一個新增、刪除或被覆寫 (快照版本不同) 的日期開始重新計算，
+    並以前一日保存的狀態接續
+    """
+    def __init__(self, position_history):
+        """
+        :param position_history: PositionHistory，時間序列與持倉快照保存在同一個資料庫
+        """
+        self.position_history = position_history
+        with closing(self.connect()) as conn, conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS category_daily ('
+                         '"日期" INTEGER NOT NULL, "股票類型" TEXT NOT NULL, "部位價值" REAL, "損益" REAL, '
+                         'PRIMARY KEY ("日期", "股票類型"))')
+            conn.execute('CREATE TABLE IF NOT EXISTS portfolio_daily ('
+                         '"日期" INTEGER PRIMARY KEY, "總價值" REAL, "未實現損益" REAL, "每日變化" REAL, '
+                         '"歷史高點" REAL, "回撤" REAL, "最大回撤" REAL, "版本" INTEGER)')
+            columns = [r[1] for r in conn.execute('PRAGMA table_info(portfolio_daily)')]
+            if '版本' not in columns:
+                # 舊版資料庫沒有記錄快照版本，下次 update() 時全部重新計算
+                conn.execute('ALTER TABLE portfolio_daily ADD COLUMN "版本" INTEGER')
+
+    def connect(self):
+        return self.position_history.connect()
+
+    def update(self):
+        """
+        計算新增或被覆寫日期的時間序列，回傳重新計算的天數
+        """
+        import numpy as np
+        with closing(self.connect()) as conn, conn:
+            versions = dict(conn.execute('SELECT v."日期", v."版本" FROM snapshot_versions v '
+                                         'WHERE EXISTS (SELECT 1 FROM positions p WHERE p."日期" = v."日期")'))
+            done = dict(conn.execute('SELECT "日期", "版本" FROM portfolio_daily'))
+            # 新增的日期、已刪除的日期，以及快照被覆寫 (盤中快照或重新匯入) 的日期之後都需要重新計算
+            changed = {date for date, version in versions.items() if done.get(date) != version}
+            changed.update(set(done) - set(versions))
+            if not changed:
+                return 0
+            start = min(changed)
+            previous = conn.execute('SELECT "總價值", "歷史高點", "最大回撤" FROM portfolio_daily WHERE "日期" < ? '
+                                    'ORDER BY "日期" DESC LIMIT 1', (start,)).fetchone()
+            rows = conn.execute('SELECT "日期", "股票類型", SUM("部位價值"), SUM("損益") FROM positions '
+                                'WHERE "日期" >= ? GROUP BY "日期", "股票類型" ORDER BY "日期"', (start,)).fetchall()
+            conn.execute('DELETE FROM category_daily WHERE "日期" >= ?', (start,))
+            conn.execute('DELETE FROM portfolio_daily WHERE "日期" >= ?', (start,))
+            if not rows:
+                return 0
+            conn.executemany('INSERT INTO category_daily VALUES (?, ?, ?, ?)', rows)
+
+            date_column = np.array([r[0] for r in rows])
+            values = np.array([r[2] or 0.0 for r in rows])
+            pnls = np.array([r[3] or 0.0 for r in rows])
+            dates, day_index = np.unique(date_column, return_inverse=True)
+            total = np.bincount(day_index, weights=values)
+            pnl = np.bincount(day_index, weights=pnls)
+            previous_total, previous_peak, previous_max_drawdown = previous or (np.nan, -np.inf, 0.0)
+            change = np.diff(total, prepend=previous_total)
+            peak = np.maximum.accumulate(np.concatenate([[previous_peak], total]))[1:]
+            drawdown = np.divide(total, peak, out=np.ones_like(total), where=peak > 0) - 1
+            max_drawdown = np.minimum.accumulate(np.concatenate([[previous_max_drawdown], drawdown]))[1:]
+            summary = np.column_stack([dates, total, pnl, change, peak, drawdown, max_drawdown]).tolist()
+            conn.executemany('INSERT INTO portfolio_daily VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             [(int(r[0]), *(None if v != v else v for v in r[1:]), versions.get(int(r[0])))
+                              for r in summary])
+        return len(dates)
+
+    def read(self, start=None, end=None):
+        """
+        讀取日期區間 [start, end] 內的時間序列
+
+        :return: (allocation, summary)；allocation 為 日期 × 股票類型 的部位價值，summary 為每日的總價值、
+                 未實現損益、每日變化、歷史高點、回撤及最大回撤，兩者皆以日期為索引
+        """
+        import pandas as pd
+        conditions, params = [], []
+        if start is not None:
+            conditions.append('"日期" >= ?')
+            params.append(PositionHistory.date_key(start))
+        if end is not None:
+            conditions.append('"日期" <= ?')
+            params.append(PositionHistory.date_key(end))
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        with closing(self.connect()) as conn:
+            category = pd.read_sql_query(f'SELECT * FROM category_daily {where} ORDER BY "日期"', conn, params=params)
+            summary = pd.read_sql_query('SELECT "日期", "總價值", "未實現損益", "每日變化", "歷史高點", "回撤", "最大回撤" '
+                                        f'FROM portfolio_daily {where} ORDER BY "日期"', conn, params=params)
+        for frame in (category, summary):
+            frame['日期'] = pd.to_datetime(frame['日期'].astype(str), format='%Y%m%d')
+        allocation = category.pivot(index='日期', columns='股票類型', values='部位價值').fillna(0.0)
+        return allocation, summary.set_index('日期')
+
+
+class TaiexHistory:
+    """
+    以交易日期為主鍵保存每日大盤資訊及說明文字，近 N 日摘要只需讀取 N 筆資料
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self.connect()) as conn, conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS taiex ('
+                         '"日期" INTEGER PRIMARY KEY, "指數" REAL, "漲跌" REAL, "漲跌比例" TEXT, "今年表現" TEXT, '
+                         '"說明" TEXT NOT NULL)')
+
+    def connect(self):
+        return sqlite3.connect(self.path)
+
+    @staticmethod
+    def _quote(taiex_info):
+        # 與資料表欄位相同型別的 (指數, 漲跌, 漲跌比例, 今年表現)
+        def to_float(value):
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return None
+
+        return (to_float(taiex_info.get('指數')), to_float(taiex_info.get('漲跌')),
+                taiex_info.get('漲跌比例'), taiex_info.get('今年表現'))
+
+    def session_date(self, taiex_info, date=None):
+        """
+        大盤資訊所屬的交易日期：StockQ 的大盤頁面不含日期，休市日 (週末、國定假日) 查詢到的是前一個交易日的收盤，
+        與最近一筆資料的報價完全相同時視為同一個交易日，否則為 date
+
+        :param taiex_info: TWStock.get_taiex_info 取得的大盤資訊
+        :param date: 查詢日期，預設為今天
+        """
+        date = date or datetime.now()
+        with closing(self.connect()) as conn:
+            row = conn.execute('SELECT "日期", "指數", "漲跌", "漲跌比例", "今年表現" FROM taiex WHERE "日期" <= ? '
+                               'ORDER BY "日期" DESC LIMIT 1', (PositionHistory.date_key(date),)).fetchone()
+        if row is not None and row[1:] == self._quote(taiex_info):
+            return datetime.strptime(str(row[0]), '%Y%m%d')
+        return datetime(date.year, date.month, date.day)
+
+    def put(self, caption, taiex_info=None, date=None):
+        """
+        寫入某交易日的大盤資訊，同一天重複寫入時會覆蓋
+
+        :param caption: 當日大盤說明文字
+        :param taiex_info: TWStock.get_taiex_info 取得的大盤資訊
+        :param date: 交易日期，預設為今天；應以 session_date 取得，避免休市日重複寫入前一個交易日的資料
+        """
+        with closing(self.connect()) as conn, conn:
+            conn.execute('INSERT OR REPLACE INTO taiex VALUES (?, ?, ?, ?, ?, ?)',
+                         (PositionHistory.date_key(date or datetime.now()), *self._quote(taiex_info or {}), caption))
+
+    def latest(self):
+        """
+        取得最近一個交易日的大盤資訊，回傳 (日期, 大盤資訊)，沒有任何資料時回傳 None
+        """
+        with closing(self.connect()) as conn:
+            row = conn.execute('SELECT "日期", "指數", "漲跌", "漲跌比例", "今年表現" FROM taiex '
+                               'ORDER BY "日期" DESC LIMIT 1').fetchone()
+        if row is None:
+            return None
+        return datetime.strptime(str(row[0]), '%Y%m%d'), dict(zip(['指數', '漲跌', '漲跌比例', '今年表現'], row[1:]))
+
+    def latest_captions(self, days=7):
+        """
+        取得最近 days 個交易日的說明文字，由新到舊排列
+        """
+        with closing(self.connect()) as conn:
+            rows = conn.execute('SELECT "說明" FROM taiex ORDER BY "日期" DESC LIMIT ?', (days,)).fetchall()
+        return [r[0] for r in rows]
+
+    def import_captions(self, caption_dir):
+        """
+        匯入既有的 {日期}_caption.txt 檔案
+
+        :param caption_dir: 說明文字檔案所在資料夾
+        """
+        imported = 0
+        for path in sorted(glob(os.path.join(caption_dir, '*_caption.txt'))):
+            matched = re.match(r'(\d{8})_caption\.txt$', os.path.basename(path))
+            if not matched:
+                continue
+            with open(path, 'r') as f:
+                self.put(f.read(), date=datetime.strptime(matched.group(1), '%Y%m%d'))
+            imported += 1
+        print(f'已匯入 {imported} 個大盤說明檔案至 {self.path}')
+        return imported
+
+
+if __name__ == '__main__':
+    # 用法: python HistoryStore.py <CSV 資料夾> [資料庫資料夾] [大盤說明檔案資料夾]
+    csv_dir = sys.argv[1] if len(sys.argv) > 1 else '.'
+    db_dir = sys.argv[2] if len(sys.argv) > 2 else csv_dir
+    caption_dir = sys.argv[3] if len(sys.argv) > 3 else csv_dir
+    position_history = PositionHistory(os.path.join(db_dir, 'position_history.db'))
+    position_history.import_csv(csv_dir)
+    PortfolioSeries(position_history).update()
+    TaiexHistory(os.path.join(db_dir, 'taiex_history.db')).import_captions(caption_dir)
@@ -0,0 +1,170 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import InsecureRequestWarning
+
+from Metrics import metrics
+
+requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+
+# 視為暫時性錯誤而重試的狀態碼
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def fixture_path(fixture_dir, url):
+    # 'https://www.stockq.org/etf' -> 'etf.html'、'/index/TWSE.php' -> 'index__TWSE.php.html'
+    name = urlsplit(url).path.strip('/').replace('/', '__') or 'index'
+    return os.path.join(fixture_dir, f'{name}.html')
+
+
+class TokenBucket:
+    """
+    令牌桶限流：平均每秒最多 rate 個請求，允許最多 capacity 個請求同時送出
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HttpClient:
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_workers=8, rate=3.0, burst=4, verify=False, timeout=None, retries=None, backoff=0.5,
+                 max_backoff=8.0, mode=None, fixture_dir=None):
+        """
+        :param max_workers: 同時抓取頁面的執行緒數量，亦為連線池大小
+        :param rate: 每秒平均請求數上限
+        :param burst: 允許瞬間送出的請求數
+        :param verify: 是否驗證 SSL 憑證
+        :param timeout: 每次請求的逾時秒數，預設為環境變數 HTTP_TIMEOUT 或 20 秒
+        :param retries: 連線失敗、逾時或 429/5xx 時的重試次數，預設為環境變數 HTTP_RETRIES 或 3 次
+        :param backoff: 第一次重試前的最長等待秒數，之後每次加倍 (實際等待時間為 0 至上限間的隨機值)
+        :param max_backoff: 重試等待秒數的上限
+        :param mode: 'live' (預設)、'record' (請求成功時將頁面保存至 fixture_dir) 或 'replay' (只從 fixture_dir
+                     讀取頁面，不連線)，預設為環境變數 HTTP_MODE
+        :param fixture_dir: 錄製及重播頁面的資料夾，預設為環境變數 HTTP_FIXTURE_DIR 或 fixtures
+        """
+        self.max_workers = max_workers
+        self.verify = verify
+        self.timeout = timeout if timeout is not None else float(os.getenv('HTTP_TIMEOUT', 20))
+        self.retries = retries if retries is not None else int(os.getenv('HTTP_RETRIES', 3))
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.mode = mode or os.getenv('HTTP_MODE', 'live')
+        if self.mode not in ('live', 'record', 'replay'):
+            raise ValueError(f'未知的 HTTP_MODE: {self.mode}')
+        self.fixture_dir = fixture_dir or os.getenv('HTTP_FIXTURE_DIR', 'fixtures')
+        self.bucket = TokenBucket(rate, burst)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @classmethod
+    def shared(cls):
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def get(self, url, **kwargs):
+        """
+        發出 GET 請求；連線失敗、逾時或 429/5xx 時以指數退避加上隨機抖動重試，重試用盡後回傳最後的回應或拋出例外
+        """
+        if self.mode == 'replay':
+            return self.replay(url)
+        kwargs.setdefault('timeout', self.timeout)
+        with metrics.timer('http', urlsplit(url).path or '/') as record:
+            for attempt in range(self.retries + 1):
+                self.bucket.acquire()
+                try:
+                    response = self.session.get(url, verify=self.verify, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    response = None
+                    if attempt == self.retries:
+                        raise
+                    print(f'請求 {url} 失敗 ({e})，第 {attempt + 1} 次重試')
+                else:
+                    if response.status_code not in RETRY_STATUS or attempt == self.retries:
+                        break
+                    print(f'請求 {url} 回應 {response.status_code}，第 {attempt + 1} 次重試')
+                record['retries'] += 1
+                time.sleep(self.retry_delay(attempt, response))
+            record['bytes'] = len(response.content)
+        if self.mode == 'record' and response.status_code == 200:
+            self.record(url, response)
+        return response
+
+    def retry_delay(self, attempt, response=None):
+        # full jitter：在 0 至 backoff * 2^attempt 之間隨機等待，避免多個請求同時重試
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), self.max_backoff))
+        return delay
+
+    def record(self, url, response):
+        # 以 UTF-8 文字保存，與 benchmark/StockQServer.py 重播的頁面格式相同
+        if response.encoding is None or response.encoding.lower() == 'iso-8859-1':
+            response.encoding = response.apparent_encoding
+        path = fixture_path(self.fixture_dir, url)
+        os.makedirs(self.fixture_dir, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(response.text)
+
+    def replay(self, url):
+        """
+        以 fixture_dir 中保存的頁面組成回應，沒有保存的頁面回應 404
+        """
+        response = requests.Response()
+        response.url = url
+        response.encoding = 'utf-8'
+        path = fixture_path(self.fixture_dir, url)
+        with metrics.timer('http', urlsplit(url).path or '/') as record:
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    response._content = f.read()
+                response.status_code = 200
+            else:
+                response._content = b''
+                response.status_code = 404
+            record['bytes'] = len(response._content)
+        return response
+
+    def map(self, fn, items):
+        """
+        在執行緒池中對每個項目執行 fn (通常為抓取並解析頁面)，依完成順序逐一回傳 (item, result)，
+        總耗時取決於最慢的頁面而非所有頁面的總和
+        """
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = {executor.submit(fn, item): item for item in items}
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,167 @@
+import cProfile
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# 同一時間只分析一個階段
+_profile_lock = threading.Lock()
+
+
+class Metrics:
+    """
+    收集單次執行的各項指標：券商 API 呼叫、HTTP 請求、圖表繪製及執行階段的耗時、傳輸量、重試及快取命中次數，
+    執行結束後可輸出為 JSON 及 Prometheus textfile collector 格式
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = time.time()
+            self.series = {}
+
+    def _series(self, kind, name):
+        key = (kind, name)
+        if key not in self.series:
+            self.series[key] = {'kind': kind, 'name': name, 'count': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                                'bytes': 0, 'retries': 0, 'cache_hits': 0, 'cache_misses': 0, 'errors': 0}
+        return self.series[key]
+
+    def observe(self, kind, name, seconds=0.0, bytes=0, retries=0, error=False):
+        with self.lock:
+            s = self._series(kind, name)
+            s['count'] += 1
+            s['seconds'] += seconds
+            s['max_seconds'] = max(s['max_seconds'], seconds)
+            s['bytes'] += bytes
+            s['retries'] += retries
+            s['errors'] += int(error)
+
+    def cache(self, kind, name, hit):
+        with self.lock:
+            s = self._series(kind, name)
+            s['cache_hits' if hit else 'cache_misses'] += 1
+
+    @contextmanager
+    def timer(self, kind, name):
+        """
+        計時一段操作，呼叫端可在 record 中填入 bytes、retries
+        """
+        record = {'bytes': 0, 'retries': 0}
+        started_at = time.perf_counter()
+        error = False
+        try:
+            yield record
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.observe(kind, name, time.perf_counter() - started_at,
+                         bytes=record['bytes'], retries=record['retries'], error=error)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'started_at': self.started_at,
+                'finished_at': time.time(),
+                'series': [dict(s) for s in self.series.values()],
+            }
+
+    def write_json(self, path):
+        snapshot = self.snapshot()
+        _atomic_write(path, json.dumps(snapshot, ensure_ascii=False, indent=2))
+        return path
+
+    def write_prometheus(self, path):
+        """
+        輸出 node_exporter textfile collector 格式 (*.prom)
+        """
+        snapshot = self.snapshot()
+        fields = [
+            ('count', 'twstock_calls_total', 'counter', '呼叫次數'),
+            ('seconds', 'twstock_duration_seconds_total', 'counter', '累計耗時'),
+            ('max_seconds', 'twstock_duration_seconds_max', 'gauge', '單次最長耗時'),
+            ('bytes', 'twstock_bytes_total', 'counter', '傳輸位元組數'),
+            ('retries', 'twstock_retries_total', 'counter', '重試次數'),
+            ('cache_hits', 'twstock_cache_hits_total', 'counter', '快取命中次數'),
+            ('cache_misses', 'twstock_cache_misses_total', 'counter', '快取未命中次數'),
+            ('errors', 'twstock_errors_total', 'counter', '錯誤次數'),
+        ]
+        lines = []
+        for field, metric, metric_type, help_text in fields:
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} {metric_type}')
+            for s in snapshot['series']:
+                name = s['name'].replace('\\', '\\\\').replace('"', '\\"')
+                lines.append(f'{metric}{{kind="{s["kind"]}",name="{name}"}} {s[field]}')
+        lines.append('# TYPE twstock_run_duration_seconds gauge')
+        lines.append(f'twstock_run_duration_seconds {snapshot["finished_at"] - snapshot["started_at"]:.3f}')
+        lines.append('# TYPE twstock_last_run_timestamp_seconds gauge')
+        lines.append(f'twstock_last_run_timestamp_seconds {snapshot["finished_at"]:.0f}')
+        _atomic_write(path, '\n'.join(lines) + '\n')
+        return path
+
+    @contextmanager
+    def profile(self, name, output_dir):
+        """
+        若環境變數 PROFILE_STAGES 包含 name (或為 all)，以 cProfile 及 tracemalloc 分析該段程式，
+        結果保存為 output_dir/profile_{name}.prof，記憶體峰值記錄於 kind='memory' 的 bytes
+        """
+        enabled = os.getenv('PROFILE_STAGES', '')
+        if not enabled or (enabled != 'all' and name not in enabled.split(',')):
+            yield
+            return
+
+        # cProfile 及 tracemalloc 都是整個程序共用的，同時執行的階段需依序分析，否則記憶體峰值會互相干擾
+        with _profile_lock:
+            profiler = cProfile.Profile()
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                _, peak = tracemalloc.get_traced_memory()
+                if started_tracing:
+                    tracemalloc.stop()
+                os.makedirs(output_dir, exist_ok=True)
+                profiler.dump_stats(os.path.join(output_dir, f'profile_{name}.prof'))
+                self.observe('memory', name, bytes=peak)
+
+
+class InstrumentedApi:
+    """
+    包裝 shioaji.Shioaji，記錄每個 API 方法呼叫的耗時與錯誤
+    """
+    def __init__(self, api, registry=None):
+        self._api = api
+        self._metrics = registry or metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self._api, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+
+        def call(*args, **kwargs):
+            with self._metrics.timer('broker', name):
+                return attr(*args, **kwargs)
+        return call
+
+
+def _atomic_write(path, text):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+# 全域共用的指標收集器
+metrics = Metrics()
@@ -0,0 +1,232 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from Metrics import metrics
+
+
+class Stage:
+    def __init__(self, name, func, deps=(), budget=None, fallback=None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.budget = budget
+        self.fallback = fallback
+        self.thread = None
+        self.started_at = None
+        self.finished_at = None
+        self.status = 'pending'
+
+    @property
+    def duration(self):
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+
+class Pipeline:
+    """
+    以相依關係圖描述的執行流程，相依條件滿足的階段會在執行緒池中同時執行，
+    結束後輸出各階段耗時與關鍵路徑
+    """
+    def __init__(self, max_workers=8, profile_dir='.', deadline=None, fatal=None):
+        """
+        :param max_workers: 同時執行的階段數上限
+        :param profile_dir: 以環境變數 PROFILE_STAGES 指定分析的階段時，分析結果的保存目錄
+        :param deadline: 整體執行的時間上限 (秒)，超過時有時間預算的階段不再等待，None 表示不限制
+        :param fatal: fatal(error) 為 True 的錯誤不使用 fallback，階段直接失敗且其下游階段不執行
+                      (例如常駐模式中券商連線逾期時，重新登入後再執行，而不是先輸出過期的資料)
+        """
+        self.max_workers = max_workers
+        self.profile_dir = profile_dir
+        self.deadline = deadline
+        self.fatal = fatal
+        self.stages = {}
+        self.results = {}
+        self.errors = {}
+        self.stale = {}
+        # 超時後不再等待的階段
+        self.abandoned = []
+        self._lock = threading.Lock()
+
+    def add(self, name, func, deps=(), budget=None, fallback=None):
+        """
+        新增一個階段
+
+        :param name: 階段名稱
+        :param func: 階段函數，會以相依階段的名稱作為關鍵字參數傳入其結果
+        :param deps: 相依的階段名稱
+        :param budget: 時間預算 (秒)，用於查詢券商或爬取網頁等外部資料的階段；超過預算或整體時間上限時不再等待該階段，
+                       None 表示不限制
+        :param fallback: 階段失敗或超過時間預算時呼叫，回傳 (上次成功的結果, 說明文字)，結果會標示為過期；
+                         沒有可用的資料時回傳 None
+        """
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f'Unknown dependency {dep} for stage {name}')
+        self.stages[name] = Stage(name, func, deps, budget=budget, fallback=fallback)
+        return self
+
+    def mark_stale(self, name, note):
+        """
+        標示階段的結果為過期資料，可在階段函數中呼叫 (例如部分頁面沿用了過期的快取)
+        """
+        with self._lock:
+            self.stale[name] = note
+
+    def stale_sources(self, name):
+        """
+        取得階段本身及其所有上游階段中，結果為過期資料者的說明文字
+        """
+        notes, visited, queue = {}, set(), [name]
+        while queue:
+            current = queue.pop()
+            if current in visited:
+                continue
+            visited.add(current)
+            if current in self.stale:
+                notes[current] = self.stale[current]
+            queue.extend(self.stages[current].deps)
+        return notes
+
+    def run_stage(self, stage):
+        stage.started_at = time.perf_counter()
+        error = False
+        try:
+            with metrics.profile(stage.name, self.profile_dir):
+                return stage.func(**{dep: self.results[dep] for dep in stage.deps})
+        except Exception:
+            error = True
+            raise
+        finally:
+            # 已超時而不再等待的階段保留停止等待的時間，其結果及耗時也不再記錄 (指標可能已屬於下一次執行)
+            if stage.status == 'running':
+                stage.finished_at = time.perf_counter()
+                metrics.observe('stage', stage.name, stage.duration, error=error)
+
+    def submit(self, executor, stage):
+        if stage.budget is None:
+            return executor.submit(self.run_stage, stage)
+        # 有時間預算的階段在獨立的 daemon 執行緒中執行，超時後不再等待，也不會阻擋程式結束
+        future = Future()
+
+        def target():
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(self.run_stage(stage))
+            except BaseException as e:
+                future.set_exception(e)
+        stage.thread = threading.Thread(target=target, name=f'stage-{stage.name}', daemon=True)
+        stage.thread.start()
+        return future
+
+    def join_abandoned(self, timeout):
+        """
+        等待已超時但仍在執行的階段結束 (例如登出券商前)，最多等待 timeout 秒
+
+        :return: 仍未結束的階段名稱
+        """
+        expires_at = time.perf_counter() + timeout
+        running = []
+        for name in self.abandoned:
+            thread = self.stages[name].thread
+            thread.join(max(expires_at - time.perf_counter(), 0))
+            if thread.is_alive():
+                running.append(name)
+        if running:
+            print(f'超時的階段 {", ".join(running)} 在 {timeout} 秒內仍未結束')
+        return running
+
+    def expires_at(self, stage):
+        # 階段的等待期限：開始時間加上時間預算，且不超過整體時間上限
+        if stage.budget is None:
+            return None
+        expires_at = time.perf_counter() + stage.budget
+        if self.deadline is not None:
+            expires_at = min(expires_at, self.started_at + self.deadline)
+        return expires_at
+
+    def settle(self, stage, result=None, error=None):
+        # 記錄階段的結果；失敗或超時的階段改用 fallback 提供的先前資料
+        if error is None:
+            self.results[stage.name] = result
+            stage.status = 'stale' if stage.name in self.stale else 'done'
+            return
+        self.errors[stage.name] = error
+        fallback = None
+        if stage.fallback is not None and not (self.fatal and self.fatal(error)):
+            try:
+                fallback = stage.fallback()
+            except Exception as e:
+                print(f'Stage {stage.name} 無法取得先前的資料: {e}')
+        if fallback is None:
+            stage.status = 'timeout' if isinstance(error, TimeoutError) else 'failed'
+            print(f'Stage {stage.name} failed: {error}')
+            return
+        self.results[stage.name], note = fallback
+        metrics.observe('stale', stage.name)
+        self.mark_stale(stage.name, note)
+        stage.status = 'stale'
+        print(f'Stage {stage.name} failed: {error}，{note}')
+
+    def run(self):
+        self.started_at = time.perf_counter()
+        pending = dict(self.stages)
+        running = {}
+        expiry = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    if any(self.stages[dep].status in ('failed', 'timeout', 'skipped') for dep in stage.deps):
+                        stage.status = 'skipped'
+                        del pending[name]
+                    elif all(self.stages[dep].status in ('done', 'stale') for dep in stage.deps):
+                        stage.status = 'running'
+                        future = self.submit(executor, stage)
+                        running[future] = stage
+                        expiry[future] = self.expires_at(stage)
+                        del pending[name]
+                if not running:
+                    continue
+                deadlines = [expires_at for expires_at in expiry.values() if expires_at is not None]
+                timeout = max(min(deadlines) - time.perf_counter(), 0) if deadlines else None
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    del expiry[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self.settle(stage, error=e)
+                    else:
+                        self.settle(stage, result=result)
+                now = time.perf_counter()
+                for future, expires_at in list(expiry.items()):
+                    if expires_at is not None and expires_at <= now:
+                        stage = running.pop(future)
+                        del expiry[future]
+                        # 先更新狀態，執行緒之後結束時便不會再記錄耗時
+                        stage.status = 'timeout'
+                        stage.finished_at = now
+                        self.abandoned.append(stage.name)
+                        metrics.observe('deadline', stage.name, stage.duration, error=True)
+                        self.settle(stage, error=TimeoutError(f'超過時間預算 ({stage.duration:.1f} 秒)，不再等待'))
+        self.finished_at = time.perf_counter()
+        return self.results
+
+    def critical_path(self):
+        # 依各階段耗時計算最長的相依鏈
+        longest = {}
+        for name, stage in self.stages.items():
+            prev = max((longest[dep] for dep in stage.deps), key=lambda p: p[0], default=(0.0, []))
+            longest[name] = (prev[0] + stage.duration, prev[1] + [name])
+        return max(longest.values(), key=lambda p: p[0], default=(0.0, []))
+
+    def report(self):
+        print(f'執行流程總耗時 {self.finished_at - self.started_at:.2f} 秒')
+        for name, stage in self.stages.items():
+            print(f'  {name:<16}{stage.status:<8}{stage.duration:8.2f} 秒')
+        for name, note in self.stale.items():
+            print(f'  {name} 使用過期資料: {note}')
+        total, path = self.critical_path()
+        print(f'關鍵路徑 ({total:.2f} 秒): {" -> ".join(path)}')
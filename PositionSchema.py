@@ -0,0 +1,53 @@
+"""
+持倉表的欄位型別：重複出現的文字欄位使用 category、數量使用 int32、價格四捨五入至固定小數位數，
+價格及部位價值、損益等金額仍為 float64 (float32 只有約 7 位有效數字，會使部位價值產生誤差)；
+持倉表建立、讀取 CSV 及持倉歷史時都套用相同的型別
+"""
+# 價格保留的小數位數 (均價可能超過兩位小數)
+PRICE_DECIMALS = 4
+
+POSITION_DTYPES = {
+    '部位代碼': 'int32',
+    '商品代碼': 'category',
+    '數量': 'int32',
+    '平均價格': 'float64',
+    '目前股價': 'float64',
+    '損益': 'float64',
+    '昨日庫存數量': 'int32',
+    '商品類型': 'category',
+    '股票類型': 'category',
+    '部位價值': 'float64',
+    '部位占比': 'float64',
+}
+PRICE_COLUMNS = ['平均價格', '目前股價']
+
+
+def apply_schema(positions):
+    """
+    將持倉表中已存在的欄位轉為 POSITION_DTYPES 的型別，型別已相符的欄位不會再轉換 (價格欄位仍會四捨五入)
+
+    :param positions: 持倉表，會直接修改並回傳
+    """
+    for name, dtype in POSITION_DTYPES.items():
+        if name not in positions.columns:
+            continue
+        if name in PRICE_COLUMNS:
+            positions[name] = positions[name].astype(dtype).round(PRICE_DECIMALS)
+            continue
+        if positions[name].dtype == dtype:
+            continue
+        column = positions[name]
+        if dtype == 'category':
+            # 商品代碼一律以文字保存，避免 0050 之類的代碼被當成數字
+            column = column.where(column.isna(), column.astype(str))
+        positions[name] = column.astype(dtype)
+    return positions
+
+
+def read_positions_csv(path):
+    """
+    讀取 list_positions_detail 匯出的持倉 CSV，並套用持倉表的欄位型別
+    """
+    import pandas as pd
+    positions = pd.read_csv(path, dtype={'商品代碼': str, '商品類型': str, '股票類型': str})
+    return apply_schema(positions)
@@ -1,11 +1,21 @@
 import shioaji as sj
-import pandas as pd
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from types import SimpleNamespace
+from BrokerSnapshot import BrokerSnapshot
+from DiskCache import DiskCache
+from Metrics import InstrumentedApi, metrics
+from PositionSchema import apply_schema
 
 
 class ShioajiStockAccount:
-    def __init__(self, api_key, secret_key):
-        self.api = sj.Shioaji()
+    def __init__(self, api_key, secret_key, snapshot_ttl=None):
+        """
+        :param snapshot_ttl: 餘額、持倉、交割等查詢結果的有效秒數，None 表示直到 refresh() 前都沿用同一次查詢
+        """
+        self.api = InstrumentedApi(sj.Shioaji())
+        self.snapshot = BrokerSnapshot(ttl=snapshot_ttl)
         self.login(api_key, secret_key)
         self.stock_account = self.api.stock_account
 
@@ -15,48 +25,105 @@ class ShioajiStockAccount:
             secret_key=secret_key
         )
 
+    def refresh(self, *resources):
+        """
+        捨棄查詢結果的快照，之後重新向券商查詢
+
+        :param resources: 'account_balance'、'list_positions'、'settlements' 等，未指定時全部捨棄
+        """
+        self.snapshot.refresh(*resources)
+
     @property
     def account_balance(self):
-        return self.api.account_balance()
+        return self.snapshot.get('account_balance', self.api.account_balance)
 
     def list_positions(self, is_df=False):
-        positions = self.api.list_positions(self.api.stock_account, unit=sj.constant.Unit.Share)
+        positions = self.snapshot.get('list_positions', lambda: self.api.list_positions(
+            self.stock_account, unit=sj.constant.Unit.Share))
         if is_df:
+            import pandas as pd
             df = pd.DataFrame(p.__dict__ for p in positions)
             df = df.drop(columns=['direction', 'margin_purchase_amount', 'collateral', 'short_sale_margin', 'interest'])
             df.columns = ['部位代碼', '商品代碼', '數量', '平均價格', '目前股價', '損益', '昨日庫存數量', '商品類型']
-            return df
+            return apply_schema(df)
 
         return positions
 
-    def list_positions_detail(self, to_csv=False, output_dir='.'):
+    def list_positions_detail(self, to_csv=False, output_dir='.', etf_category=None, history=None):
         positions = self.list_positions(is_df=True)
+        return self.classify_positions(positions, etf_category=etf_category, to_csv=to_csv, output_dir=output_dir,
+                                       history=history)
 
-        def product_total_value(current_share_price, quantity):
-            return current_share_price * quantity
+    @staticmethod
+    def classify_positions(positions, etf_category=None, to_csv=False, output_dir='.', history=None):
+        """
+        為持倉表加上股票類型、部位價值及部位占比
 
-        from TWStock import ETFCategory
-        etf_c = ETFCategory()
-        positions['股票類型'] = positions['商品代碼'].apply(lambda x: etf_c.num_to_name(x))
-        positions['部位價值'] = positions.apply(lambda x: product_total_value(x['目前股價'], x['數量']), axis=1)
+        :param positions: list_positions(is_df=True) 取得的持倉表
+        :param etf_category: 已建立的 ETFCategory，未提供時會重新建立
+        :param history: PositionHistory，提供時會將今日快照寫入持倉歷史
+        """
+        if etf_category is None:
+            from TWStock import ETFCategory
+            etf_category = ETFCategory()
+        positions['股票類型'] = etf_category.nums_to_names(positions['商品代碼'])
+        positions['部位價值'] = positions['目前股價'] * positions['數量']
         positions['部位占比'] = positions['部位價值'] / positions['部位價值'].sum() * 100
+        apply_schema(positions)
         if to_csv:
             today = datetime.now().strftime('%Y%m%d')
             positions.to_csv(f'{output_dir}/{today}_positions.csv', index=False)
+        if history is not None:
+            history.append(positions)
         return positions
 
-    def get_all_loss_summary(self):
+    def get_all_loss_summary(self, cache_dir='.', max_workers=4):
+        """
+        統計 2019 年至今每年的已實現損益；已結束年度的結果不會再變動，會永久保存於 cache_dir，
+        之後只需向券商查詢今年的資料
+
+        :param cache_dir: 已結束年度損益快取的保存目錄
+        :param max_workers: 同時向券商查詢的年度數上限
+        """
         def year_duration(year):
             start_date = datetime(year, 1, 1).strftime('%Y-%m-%d')
             end_date = datetime(year, 12, 31).strftime('%Y-%m-%d')
             return start_date, end_date
 
-        all_loss_summary = {}
-        for year in range(2019, datetime.now().year + 1):
+        def query_year(year):
             start_date, end_date = year_duration(year)
-            loss_summary_year = self.api.list_profit_loss_summary(self.api.stock_account, start_date, end_date).total
-            if str(loss_summary_year):
-                all_loss_summary[year] = loss_summary_year
+            return self.snapshot.get(f'list_profit_loss_summary:{year}', lambda: self.api.list_profit_loss_summary(
+                self.stock_account, start_date, end_date)).total
+
+        this_year = datetime.now().year
+        account_id = getattr(self.stock_account, 'account_id', '')
+        cache = DiskCache(os.path.join(cache_dir, 'loss_summary_cache.json'))
+        years = range(2019, this_year + 1)
+        loss_summary_years = {}
+        missing_years = []
+        for year in years:
+            entry = cache.get(f'{account_id}:{year}')
+            if year < this_year:
+                metrics.cache('cache', 'loss_summary', entry is not None)
+            if year < this_year and entry is not None:
+                loss_summary_years[year] = SimpleNamespace(**entry['value']) if entry['value'] is not None else None
+            else:
+                missing_years.append(year)
+
+        if missing_years:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(missing_years))) as executor:
+                for year, loss_summary_year in zip(missing_years, executor.map(query_year, missing_years)):
+                    if not str(loss_summary_year):
+                        loss_summary_year = None
+                    loss_summary_years[year] = loss_summary_year
+                    if year < this_year:
+                        cache.put(f'{account_id}:{year}', self.plain_dict(loss_summary_year) if loss_summary_year is not None else None)
+            cache.save()
+
+        all_loss_summary = {}
+        for year in years:
+            if loss_summary_years[year] is not None:
+                all_loss_summary[year] = loss_summary_years[year]
         else:
             total = {'quantity': 0, 'buy_cost': 0, 'sell_cost': 0, 'pnl': 0.0, 'pr_ratio': 0.0}
             for year, loss_summary in all_loss_summary.items():
@@ -69,9 +136,15 @@ class ShioajiStockAccount:
                 all_loss_summary['total'] = total
                 return all_loss_summary
 
+    @staticmethod
+    def plain_dict(obj):
+        # 僅保留可 JSON 序列化的欄位，供寫入快取
+        return {k: v for k, v in obj.__dict__.items() if isinstance(v, (int, float, str, bool)) or v is None}
+
     def settlements(self, is_df=False):
-        settlements = self.api.settlements(self.api.stock_account)
+        settlements = self.snapshot.get('settlements', lambda: self.api.settlements(self.stock_account))
         if is_df:
+            import pandas as pd
             df = pd.DataFrame(s.__dict__ for s in settlements).set_index('T')
             return df
 
@@ -0,0 +1,52 @@
+"""
+StockQ 頁面的精簡解析：以 SoupStrainer 只建立需要的標籤 (indexpagetable 表格、指定標題的連結、table#matrix)，
+不建立整頁的樹狀結構；有安裝 lxml 時使用 lxml 解析器
+"""
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml  # noqa: F401
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
+
+
+def parse_taiex(html):
+    """
+    解析大盤頁面的 indexpagetable 表格，回傳 {欄位: 值}；表格格式不符時回傳 None
+    """
+    page = BeautifulSoup(html, PARSER, parse_only=SoupStrainer('table', class_='indexpagetable'))
+    taiex_index_page_table = page.find('table', {'class': "indexpagetable"})
+    if taiex_index_page_table is None:
+        return None
+    taiex_index_table = taiex_index_page_table.find_all('tr')
+    if len(taiex_index_table) != 2:
+        return None
+    taiex_index_title = [t.text for t in taiex_index_table[0].find_all('td')]
+    taiex_index_value = [v.text for v in taiex_index_table[1].find_all('td')]
+    return dict(zip(taiex_index_title, taiex_index_value))
+
+
+def find_links(html, titles):
+    """
+    找出頁面中 title 屬於 titles 的 <a> 連結，回傳 {title: href}，同一 title 以第一個出現的為準
+    """
+    titles = set(titles)
+    page = BeautifulSoup(html, PARSER, parse_only=SoupStrainer('a', title=lambda t: t in titles))
+    links = {}
+    for a in page.find_all('a'):
+        links.setdefault(a['title'], a['href'])
+    return links
+
+
+def iter_matrix_codes(html):
+    """
+    逐一產生 table#matrix 中每列第一欄的商品代碼，略過以 <font> 標示的標題列
+    """
+    page = BeautifulSoup(html, PARSER, parse_only=SoupStrainer('table', id='matrix'))
+    for t in page.find_all('table', id='matrix'):
+        for p in t.find_all('tr'):
+            etf_tag = p.find('td')
+            if etf_tag.find('font'):
+                continue
+            yield str(etf_tag.contents[0])
@@ -0,0 +1,225 @@
+"""
+即時持倉估值：訂閱持有商品的成交報價，逐筆以 O(1) 更新各持倉及股票類型的部位價值與損益，並以固定間隔重新繪圖
+
+報價來源可替換：ShioajiFeed 使用券商的即時報價，ReplayFeed 重播事先記錄的報價 (測試及基準測試用)
+"""
+import csv
+import threading
+import time
+from PositionSchema import apply_schema
+
+
+class LiveValuation:
+    """
+    以 list_positions_detail 的持倉表為起點，逐筆套用報價；每筆報價只更新該商品的持倉及其所屬類型的合計
+    """
+    def __init__(self, positions):
+        self.positions = positions.reset_index(drop=True)
+        self.categories = list(dict.fromkeys(self.positions['股票類型']))
+        category_ids = {name: i for i, name in enumerate(self.categories)}
+        self._quantity = self.positions['數量'].astype(float).tolist()
+        self._price = self.positions['目前股價'].astype(float).tolist()
+        self._pnl = self.positions['損益'].astype(float).tolist()
+        self._value = [q * p for q, p in zip(self._quantity, self._price)]
+        self._category = [category_ids[name] for name in self.positions['股票類型']]
+        # 同一商品可能有多筆持倉 (例如不同的部位代碼)
+        self._rows = {}
+        for i, code in enumerate(self.positions['商品代碼']):
+            self._rows.setdefault(str(code), []).append(i)
+        self._category_value = [0.0] * len(self.categories)
+        self._category_pnl = [0.0] * len(self.categories)
+        for i, c in enumerate(self._category):
+            self._category_value[c] += self._value[i]
+            self._category_pnl[c] += self._pnl[i]
+        self.total_value = sum(self._value)
+        self.version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def codes(self):
+        return list(self._rows)
+
+    def apply(self, code, price):
+        """
+        套用一筆報價，回傳是否為持有的商品
+        """
+        rows = self._rows.get(code)
+        if rows is None:
+            return False
+        with self._lock:
+            for i in rows:
+                delta = (price - self._price[i]) * self._quantity[i]
+                self._price[i] = price
+                self._value[i] += delta
+                self._pnl[i] += delta
+                c = self._category[i]
+                self._category_value[c] += delta
+                self._category_pnl[c] += delta
+                self.total_value += delta
+            self.version += 1
+        return True
+
+    def category_totals(self):
+        """
+        各股票類型目前的部位價值、部位占比及損益
+        """
+        with self._lock:
+            return {name: {'部位價值': value, '部位占比': value / self.total_value * 100 if self.total_value else 0.0,
+                           '損益': pnl}
+                    for name, value, pnl in zip(self.categories, self._category_value, self._category_pnl)}
+
+    def snapshot(self):
+        """
+        以目前的報價產生與 list_positions_detail 欄位相同的持倉表，供繪圖使用；回傳 (版本, 持倉表)
+        """
+        with self._lock:
+            version = self.version
+            price, value, pnl = list(self._price), list(self._value), list(self._pnl)
+        positions = self.positions.copy()
+        positions['目前股價'] = price
+        positions['損益'] = pnl
+        positions['部位價值'] = value
+        positions['部位占比'] = positions['部位價值'] / positions['部位價值'].sum() * 100
+        return version, apply_schema(positions)
+
+
+class ReplayFeed:
+    """
+    重播事先記錄的報價，每筆報價為 (時間秒數, 商品代碼, 價格)
+    """
+    def __init__(self, ticks, speed=None):
+        """
+        :param ticks: 依時間排序的報價
+        :param speed: 重播速度倍率，None 表示不等待、盡快送出
+        """
+        self.ticks = ticks
+        self.speed = speed
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_csv(cls, path, speed=None):
+        """
+        讀取欄位為 時間,商品代碼,價格 的報價 CSV
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            ticks = [(float(row['時間']), row['商品代碼'], float(row['價格'])) for row in csv.DictReader(f)]
+        return cls(ticks, speed=speed)
+
+    @staticmethod
+    def to_csv(ticks, path):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['時間', '商品代碼', '價格'])
+            writer.writerows(ticks)
+
+    def start(self, codes, on_tick):
+        codes = set(codes)
+
+        def replay():
+            started_at = time.monotonic()
+            first = None
+            for timestamp, code, price in self.ticks:
+                if self._stop.is_set():
+                    break
+                if code not in codes:
+                    continue
+                if self.speed:
+                    first = timestamp if first is None else first
+                    delay = (timestamp - first) / self.speed - (time.monotonic() - started_at)
+                    if delay > 0 and self._stop.wait(delay):
+                        break
+                on_tick(code, price)
+
+        self._thread = threading.Thread(target=replay, name='ReplayFeed', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout=None):
+        """
+        等待重播結束，回傳是否已結束
+        """
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+
+class ShioajiFeed:
+    """
+    訂閱永豐金 Shioaji 的股票逐筆成交報價
+    """
+    def __init__(self, api):
+        self.api = api
+        self._contracts = []
+        self._stop = threading.Event()
+
+    def start(self, codes, on_tick):
+        import shioaji as sj
+        self.api.quote.set_on_tick_stk_v1_callback(lambda exchange, tick: on_tick(tick.code, float(tick.close)))
+        for code in codes:
+            contract = self.api.Contracts.Stocks[code]
+            if contract is None:
+                print(f'找不到商品 {code} 的合約，略過訂閱')
+                continue
+            self.api.quote.subscribe(contract, quote_type=sj.constant.QuoteType.Tick,
+                                     version=sj.constant.QuoteVersion.v1)
+            self._contracts.append(contract)
+        return self
+
+    def stop(self):
+        import shioaji as sj
+        for contract in self._contracts:
+            self.api.quote.unsubscribe(contract, quote_type=sj.constant.QuoteType.Tick,
+                                       version=sj.constant.QuoteVersion.v1)
+        self._contracts = []
+        self._stop.set()
+
+    def join(self, timeout=None):
+        # 即時報價沒有結束的時間，直到 stop() 為止
+        return self._stop.wait(timeout)
+
+
+class ThrottledRenderer:
+    """
+    在背景執行緒中每 interval 秒檢查一次，持倉估值有更新時才以 render(positions) 重新繪圖
+    """
+    def __init__(self, valuation, render, interval=10.0):
+        self.valuation = valuation
+        self.render = render
+        self.interval = interval
+        self.renders = 0
+        self._rendered_version = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def render_if_changed(self):
+        if self.valuation.version == self._rendered_version:
+            return False
+        version, positions = self.valuation.snapshot()
+        try:
+            self.render(positions)
+        except Exception as e:
+            print(f'即時繪圖失敗: {e}')
+        self._rendered_version = version
+        self.renders += 1
+        return True
+
+    def start(self):
+        def loop():
+            while not self._stop.wait(self.interval):
+                self.render_if_changed()
+
+        self._thread = threading.Thread(target=loop, name='ThrottledRenderer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        停止定期繪圖，並將最後的報價繪製一次
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.render_if_changed()
@@ -1,67 +1,127 @@
+import os
+from datetime import datetime
 import requests
-import time
-from requests.packages.urllib3.exceptions import InsecureRequestWarning
-from bs4 import BeautifulSoup
-
-requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+from DiskCache import DiskCache
+from HttpClient import HttpClient
+from Metrics import metrics
+from StockQParser import find_links, iter_matrix_codes, parse_taiex
 
 
 class TWStock:
     @staticmethod
-    def get_taiex_info():
-        taiex_query_url = 'https://www.stockq.org/index/TWSE.php'
-        response = requests.get(taiex_query_url, verify=False)
+    def get_taiex_info(root_query_url=None, http_client=None):
+        root_query_url = root_query_url or os.getenv('STOCKQ_ROOT_URL', 'https://www.stockq.org')
+        taiex_query_url = f'{root_query_url}/index/TWSE.php'
+        try:
+            response = (http_client or HttpClient.shared()).get(taiex_query_url)
+        except requests.RequestException as e:
+            print(f'Failed to get TAIEX info from {taiex_query_url}: {e}')
+            return None
         if response.status_code != 200:
             print(f'Failed to get ETF info from www.stockq.org, status code: {response.status_code}')
             return None
-        page = BeautifulSoup(response.text, 'html.parser')
-        taiex_index_page_table = page.find('table', {'class': "indexpagetable"})
-        taiex_index_table = taiex_index_page_table.find_all('tr')
-        if len(taiex_index_table) != 2:
+        taiex_info = parse_taiex(response.text)
+        if taiex_info is None:
             print(f'Failed to get TAIEX info from {taiex_query_url}')
             return None
-        taiex_index_title = [t.text for t in taiex_index_table[0].find_all('td')]
-        taiex_index_value = [v.text for v in taiex_index_table[1].find_all('td')]
 
-        return dict(zip(taiex_index_title, taiex_index_value))
+        return taiex_info
 
 
 class ETFCategory:
-    def __init__(self):
-        self.etf_query_url = 'https://www.stockq.org/etf'
-        self.root_query_url = 'https://www.stockq.org'
+    def __init__(self, cache_dir=None, cache_ttl=None, force_refresh=False, http_client=None,
+                 root_query_url=None, offline=False):
+        """
+        :param cache_dir: ETF 分類快取的保存目錄，預設為環境變數 PRIVATE_OUTPUT_DIR 或當前資料夾
+        :param cache_ttl: 快取有效秒數，預設為環境變數 ETF_CACHE_TTL 或一天；過期後以 ETag/Last-Modified 向伺服器驗證
+        :param force_refresh: 是否忽略快取，強制重新爬取所有頁面
+        :param http_client: 抓取頁面所使用的 HttpClient，預設為共用的連線池
+        :param root_query_url: StockQ 網站根網址，預設為環境變數 STOCKQ_ROOT_URL 或 https://www.stockq.org，
+                               可指向本地的頁面重播伺服器
+        :param offline: 只使用快取 (不論是否過期)，不發出任何請求；用於爬取超過時間預算時沿用先前的分類
+        """
+        self.root_query_url = root_query_url or os.getenv('STOCKQ_ROOT_URL', 'https://www.stockq.org')
+        self.etf_query_url = f'{self.root_query_url}/etf'
+        if cache_dir is None:
+            cache_dir = os.getenv('PRIVATE_OUTPUT_DIR', '.')
+        if cache_ttl is None:
+            cache_ttl = float(os.getenv('ETF_CACHE_TTL', 24 * 60 * 60))
+        self.cache_ttl = cache_ttl
+        self.offline = offline
+        self.force_refresh = not offline and (force_refresh or os.getenv('ETF_CACHE_FORCE_REFRESH', '0') == '1')
+        # 沿用過期快取的頁面及其保存時間
+        self.stale_pages = {}
+        self.cache = DiskCache(os.path.join(cache_dir, 'etf_category_cache.json'))
+        self.http = http_client or HttpClient.shared()
         self.etf_category_url = self.cate_url()
         self.etf_category = self.etf_cate()
-
-    def get_taiex_info(self):
-        taiex_query_url = 'https://www.stockq.org/index/TWSE.php'
-        response = requests.get(taiex_query_url, verify=False)
-        if response.status_code != 200:
-            print(f'Failed to get ETF info from www.stockq.org, status code: {response.status_code}')
-            return None
-        page = BeautifulSoup(response.text, 'html.parser')
-        taiex_index_page_table = page.find('table', {'class': "indexpagetable"})
-        taiex_index_table = taiex_index_page_table.find_all('tr')
-        if len(taiex_index_table) != 2:
-            print(f'Failed to get TAIEX info from {self.taiex_query_url}')
+        self.code_index = self.build_code_index()
+        self.cache.save()
+
+    def cached_page(self, url, parse):
+        """
+        取得頁面解析後的結果，快取未過期時不發出任何請求；過期時帶上 ETag/Last-Modified 進行條件式請求，
+        伺服器回應 304 則沿用快取內容
+
+        :param url: 頁面網址
+        :param parse: 將頁面 HTML 轉為可 JSON 序列化結果的函數
+        """
+        entry = None if self.force_refresh else self.cache.get(url)
+        if self.offline:
+            if entry is None:
+                print(f'No cached ETF info for {url}')
+                return None
+            self.stale_pages[url] = entry['saved_at']
+            return entry['value']
+        if DiskCache.is_fresh(entry, self.cache_ttl):
+            metrics.cache('cache', 'etf_category', True)
+            return entry['value']
+        metrics.cache('cache', 'etf_category', False)
+
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        try:
+            response = self.http.get(url, headers=headers)
+        except requests.RequestException as e:
+            response = None
+            error = e
+        else:
+            error = f'status code: {response.status_code}'
+        if response is not None and response.status_code == 304 and entry is not None:
+            self.cache.touch(url)
+            return entry['value']
+        if response is None or response.status_code != 200:
+            # 重試後仍失敗時沿用過期的快取內容，不讓單一頁面的錯誤使整個分類失效
+            if entry is not None:
+                self.stale_pages[url] = entry['saved_at']
+                print(f'Failed to get ETF info from {url} ({error}), '
+                      f'using cached data from {datetime.fromtimestamp(entry["saved_at"]):%Y-%m-%d %H:%M}')
+                return entry['value']
+            print(f'Failed to get ETF info from {url}, {error}')
             return None
-        taiex_index_title = [t.text for t in taiex_index_table[0].find_all('td')]
-        taiex_index_value = [v.text for v in taiex_index_table[1].find_all('td')]
-
-        return dict(zip(taiex_index_title, taiex_index_value))
+        value = parse(response.text)
+        self.cache.put(url, value,
+                       etag=response.headers.get('ETag'),
+                       last_modified=response.headers.get('Last-Modified'))
+        return value
 
+    def get_taiex_info(self):
+        return TWStock.get_taiex_info(self.root_query_url, self.http)
 
     def cate_url(self):
-        response = requests.get(self.etf_query_url, verify=False)
-        if response.status_code != 200:
-            print(f'Failed to get ETF info from www.stockq.org, status code: {response.status_code}')
-            return None
+        return self.cached_page(self.etf_query_url, self.parse_cate_url)
+
+    def parse_cate_url(self, html):
         category_url = {'高股息ETF': [], '市值型/指數型ETF': [], '槓桿型ETF': [], '債券ETF': []}
-        page = BeautifulSoup(response.text, 'html.parser')
+        links = find_links(html, ['高股息ETF', '正2反1 槓桿型ETF', '台灣ETF', '美國政府長期公債ETF', '投資級公司債ETF',
+                                  '非投資等級公司債ETF', '新興市場債ETF'])
 
         def get_href(search_title):
-            nonlocal page
-            return page.find('a', title=search_title)['href']
+            return links[search_title]
 
         category_url['高股息ETF'].append(self.root_query_url + get_href('高股息ETF'))
         category_url['槓桿型ETF'].append(self.root_query_url + get_href('正2反1 槓桿型ETF'))
@@ -77,40 +137,53 @@ class ETFCategory:
         return category_url
 
     def etf_cate(self):
+        if self.etf_category_url is None:
+            return None
         r = {'高股息ETF': set(), '市值型/指數型ETF': set(), '槓桿型ETF': set(), '債券ETF': set()}
-        for cate, urls in self.etf_category_url.items():
-            for u in urls:
-                time.sleep(0.3)
-                response = requests.get(u, verify=False)
-                if response.status_code != 200:
-                    print(f'Failed to get ETF info from {u}, status code: {response.status_code}')
-                    return None
-                page = BeautifulSoup(response.text, 'html.parser')
-                tables_in_page = page.find_all('table', id='matrix')
-                for t in tables_in_page:
-                    products = t.find_all('tr')
-                    for p in products:
-                        etf_tag = p.find('td')
-                        if etf_tag.find('font'):
-                            continue
-                        etf_num = etf_tag.contents[0]
-                        # print(cate, etf_num)
-                        r[cate].add(etf_num)
+        jobs = [(cate, u) for cate, urls in self.etf_category_url.items() for u in urls]
+        # 各分類頁面同時抓取，並在其他頁面仍在下載時解析已完成的頁面
+        for (cate, u), etf_nums in self.http.map(lambda job: self.cached_page(job[1], self.parse_etf_nums), jobs):
+            if etf_nums is None:
+                # 單一分類頁面失敗時只略過該頁面，其餘分類仍可使用
+                print(f'略過無法取得的 {cate} 分類頁面: {u}')
+                continue
+            r[cate].update(etf_nums)
 
         else:
             r['市值型/指數型ETF'] = r['市值型/指數型ETF'] - r['高股息ETF'] - r['槓桿型ETF'] - r['債券ETF']
             return r
 
+    @staticmethod
+    def parse_etf_nums(html):
+        return list(iter_matrix_codes(html))
+
+    def build_code_index(self):
+        """
+        建立商品代碼 -> 股票類型的索引，同一代碼出現在多個分類時以分類順序較前者為準
+        """
+        code_index = {}
+        for cate, etfs in (self.etf_category or {}).items():
+            for etf_num in etfs:
+                code_index.setdefault(etf_num, cate)
+        return code_index
+
     def num_to_name(self, num: str):
-        for cate, etfs in self.etf_category.items():
-            if num in etfs:
-                return cate
-        return "個股"
+        return self.code_index.get(num, "個股")
+
+    def nums_to_names(self, nums):
+        """
+        一次查詢整欄商品代碼的股票類型
 
+        :param nums: 商品代碼的 pandas.Series
+        """
+        if nums.dtype == 'category':
+            # category 欄位只需對每個不重複的代碼查詢一次，結果仍為 category
+            return nums.map(self.num_to_name)
+        return nums.map(self.code_index).fillna("個股")
 
 if __name__ == '__main__':
     etf = ETFCategory()
     # print(etf.etf_category_url)
     # print(etf.etf_category)
     # print(etf.num_to_name('00919'))
-    print(etf.get_taiex())
\ No newline at end of file
+    print(etf.get_taiex_info())
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+模擬 shioaji 套件的替身，不需券商帳號或網路即可執行 ShioajiStockAccount
+
+用法：在 import StockAccount 之前呼叫 install()，之後建立的 sj.Shioaji() 都會是 FakeShioaji
+"""
+import sys
+import time
+import types
+from datetime import datetime
+
+
+class Unit:
+    Common = 'Common'
+    Share = 'Share'
+
+
+class Position:
+    def __init__(self, id, code, quantity, price, last_price, pnl, yd_quantity):
+        # 欄位順序與 shioaji.position.StockPosition 相同
+        self.id = id
+        self.code = code
+        self.direction = 'Buy'
+        self.quantity = quantity
+        self.price = price
+        self.last_price = last_price
+        self.pnl = pnl
+        self.yd_quantity = yd_quantity
+        self.cond = 'Cash'
+        self.margin_purchase_amount = 0
+        self.collateral = 0
+        self.short_sale_margin = 0
+        self.interest = 0
+
+
+class ProfitLossSummaryTotal:
+    def __init__(self, quantity, buy_cost, sell_cost, pnl, pr_ratio):
+        self.quantity = quantity
+        self.buy_cost = buy_cost
+        self.sell_cost = sell_cost
+        self.pnl = pnl
+        self.pr_ratio = pr_ratio
+
+    def __str__(self):
+        return f'quantity={self.quantity} buy_cost={self.buy_cost} sell_cost={self.sell_cost} pnl={self.pnl}'
+
+
+class Settlement:
+    def __init__(self, date, amount, T):
+        self.date = date
+        self.amount = amount
+        self.T = T
+
+
+class FakeShioaji:
+    # 可在 install() 時調整的設定
+    n_positions = 100
+    latency = 0.0
+    seed = 0
+    # 登入後經過 session_ttl 秒，API 呼叫會如同 token 逾期般失敗，None 表示不會逾期
+    session_ttl = None
+
+    def __init__(self, simulation=False):
+        self.simulation = simulation
+        self.stock_account = types.SimpleNamespace(account_id='0000000', broker_id='9A95')
+        self.calls = {}
+        self.logged_in = False
+        self.logged_in_at = None
+
+    def _call(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+        if name not in ('login', 'logout') and self.session_ttl is not None \
+                and time.monotonic() - self.logged_in_at > self.session_ttl:
+            raise RuntimeError('Token is expired, please login again')
+
+    def login(self, api_key=None, secret_key=None, **kwargs):
+        self._call('login')
+        self.logged_in = True
+        self.logged_in_at = time.monotonic()
+        return [self.stock_account]
+
+    def logout(self):
+        self._call('logout')
+        self.logged_in = False
+        return True
+
+    def account_balance(self):
+        self._call('account_balance')
+        return types.SimpleNamespace(acc_balance=1_000_000.0, date=datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f'),
+                                     errmsg='')
+
+    def list_positions(self, account=None, unit=Unit.Common):
+        self._call('list_positions')
+        from SyntheticPortfolio import synthetic_positions
+        positions = synthetic_positions(self.n_positions, seed=self.seed)
+        return [Position(row['部位代碼'], row['商品代碼'], row['數量'], row['平均價格'], row['目前股價'],
+                         row['損益'], row['昨日庫存數量'])
+                for row in positions.to_dict('records')]
+
+    def list_profit_loss_summary(self, account=None, begin_date=None, end_date=None):
+        self._call('list_profit_loss_summary')
+        year = int(begin_date[:4])
+        buy_cost = 100_000 * (year - 2018)
+        pnl = 1_000.0 * (year - 2018)
+        total = ProfitLossSummaryTotal(10 * (year - 2018), buy_cost, buy_cost + pnl, pnl,
+                                       round(pnl / buy_cost * 100, 2))
+        return types.SimpleNamespace(profitloss_summary=[], total=total)
+
+    def settlements(self, account=None):
+        self._call('settlements')
+        today = datetime.now().strftime('%Y-%m-%d')
+        return [Settlement(today, -1000.0 * t, t) for t in range(3)]
+
+
+def install(n_positions=100, latency=0.0, seed=0, session_ttl=None):
+    """
+    以 FakeShioaji 取代 sys.modules 中的 shioaji
+
+    :param n_positions: list_positions 回傳的持倉數量
+    :param latency: 每次 API 呼叫的模擬延遲秒數
+    :param seed: 產生持倉的亂數種子
+    :param session_ttl: 模擬登入後 token 逾期的秒數，用於測試常駐模式的重新登入
+    """
+    FakeShioaji.n_positions = n_positions
+    FakeShioaji.latency = latency
+    FakeShioaji.seed = seed
+    FakeShioaji.session_ttl = session_ttl
+    module = types.ModuleType('shioaji')
+    module.Shioaji = FakeShioaji
+    module.constant = types.SimpleNamespace(Unit=Unit)
+    sys.modules['shioaji'] = module
+    return module
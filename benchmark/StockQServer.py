@@ -0,0 +1,102 @@
+"""
+在本地重播已保存的 StockQ 頁面，供 TWStock/ETFCategory 在離線狀態下執行
+
+用法：
+    python StockQServer.py <頁面資料夾> [port]
+    python StockQServer.py --record <頁面資料夾>    # 從 www.stockq.org 下載並保存頁面
+"""
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from HttpClient import fixture_path  # noqa: E402
+
+
+class StockQServer:
+    def __init__(self, fixture_dir, port=0, latency=0.0):
+        """
+        :param fixture_dir: 保存頁面的資料夾
+        :param port: 監聽的埠號，0 表示自動選擇
+        :param latency: 每個回應的模擬延遲秒數
+        """
+        self.fixture_dir = fixture_dir
+        self.latency = latency
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                if server.latency:
+                    threading.Event().wait(server.latency)
+                path = fixture_path(server.fixture_dir, self.path)
+                if not os.path.exists(path):
+                    self.send_error(404)
+                    return
+                with open(path, 'rb') as f:
+                    body = f.read()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.thread = None
+
+    @property
+    def root_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def record_pages(fixture_dir, root_query_url='https://www.stockq.org'):
+    """
+    下載 ETFCategory 及 TWStock 會用到的所有頁面並保存至 fixture_dir
+    """
+    from HttpClient import HttpClient
+    from TWStock import ETFCategory
+
+    # 錄製模式下每個成功的請求都會保存至 fixture_dir
+    client = HttpClient(mode='record', fixture_dir=fixture_dir)
+    etf_category = ETFCategory.__new__(ETFCategory)
+    etf_category.root_query_url = root_query_url
+    urls = [f'{root_query_url}/etf', f'{root_query_url}/index/TWSE.php']
+    index_html = client.get(urls[0]).text
+    print(f'已保存 {urls[0]}')
+    urls += [u for us in etf_category.parse_cate_url(index_html).values() for u in us]
+    for url in urls[1:]:
+        client.get(url)
+        print(f'已保存 {url}')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--record':
+        record_pages(sys.argv[2])
+    else:
+        fixture_dir = sys.argv[1] if len(sys.argv) > 1 else 'fixtures'
+        port = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+        server = StockQServer(fixture_dir, port=port)
+        print(f'重播 {fixture_dir} 中的頁面於 {server.root_url}')
+        server.httpd.serve_forever()
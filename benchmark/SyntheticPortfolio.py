@@ -0,0 +1,130 @@
+"""
+產生基準測試用的合成持倉資料及 StockQ 頁面
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+# 各分類頁面對應的合成 ETF 代碼，與 ETFCategory.cate_url 中搜尋的連結標題一致
+CATEGORY_PAGES = {
+    '高股息ETF': [f'00{900 + i}' for i in range(40)],
+    '正2反1 槓桿型ETF': [f'00{630 + i}L' for i in range(30)],
+    '台灣ETF': [f'00{50 + i:03d}' for i in range(120)] + [f'00{900 + i}' for i in range(10)],
+    '美國政府長期公債ETF': [f'00{679 + i}B' for i in range(20)],
+    '投資級公司債ETF': [f'00{720 + i}B' for i in range(30)],
+    '非投資等級公司債ETF': [f'00{760 + i}B' for i in range(15)],
+    '新興市場債ETF': [f'00{780 + i}B' for i in range(15)],
+}
+STOCK_CODES = [str(1101 + i) for i in range(800)]
+
+
+def code_universe():
+    etf_codes = sorted({code for codes in CATEGORY_PAGES.values() for code in codes})
+    return etf_codes + STOCK_CODES
+
+
+def synthetic_positions(n, seed=0):
+    """
+    產生 n 筆與 list_positions(is_df=True) 欄位相同的持倉，同一代碼可重複出現 (模擬多帳戶合併)
+    """
+    rng = np.random.default_rng(seed)
+    codes = np.array(code_universe())
+    quantity = rng.integers(1, 20, n) * 1000
+    price = rng.uniform(10, 600, n).round(2)
+    last_price = (price * rng.normal(1.0, 0.15, n)).round(2)
+    changed = rng.random(n) < 0.2
+    yd_quantity = np.where(changed, np.maximum(quantity + rng.integers(-5, 5, n) * 1000, 0), quantity)
+    return pd.DataFrame({
+        '部位代碼': np.arange(n),
+        '商品代碼': codes[rng.integers(0, len(codes), n)],
+        '數量': quantity,
+        '平均價格': price,
+        '目前股價': last_price,
+        '損益': ((last_price - price) * quantity).round(0),
+        '昨日庫存數量': yd_quantity,
+        '商品類型': 'Cash',
+    })
+
+
+def synthetic_positions_detail(n, seed=0):
+    """
+    產生 n 筆與 list_positions_detail 欄位及型別相同的持倉
+    """
+    from PositionSchema import apply_schema
+    positions = synthetic_positions(n, seed=seed)
+    code_index = {}
+    for title, cate in [('高股息ETF', '高股息ETF'), ('正2反1 槓桿型ETF', '槓桿型ETF'),
+                        ('美國政府長期公債ETF', '債券ETF'), ('投資級公司債ETF', '債券ETF'),
+                        ('非投資等級公司債ETF', '債券ETF'), ('新興市場債ETF', '債券ETF'),
+                        ('台灣ETF', '市值型/指數型ETF')]:
+        for code in CATEGORY_PAGES[title]:
+            code_index.setdefault(code, cate)
+    positions['股票類型'] = positions['商品代碼'].map(code_index).fillna('個股')
+    positions['部位價值'] = positions['目前股價'] * positions['數量']
+    positions['部位占比'] = positions['部位價值'] / positions['部位價值'].sum() * 100
+    return apply_schema(positions)
+
+
+def synthetic_ticks(positions, n_ticks, seed=0, interval=0.01):
+    """
+    以持倉的商品代碼及目前股價產生隨機漫步的逐筆報價 (時間秒數, 商品代碼, 價格)，供 ReplayFeed 重播
+    """
+    rng = np.random.default_rng(seed)
+    last_price = positions.groupby('商品代碼')['目前股價'].first()
+    codes = last_price.index.to_numpy()
+    prices = dict(zip(codes, last_price.to_numpy(dtype=float)))
+    picks = codes[rng.integers(0, len(codes), n_ticks)]
+    moves = rng.normal(0, 0.002, n_ticks)
+    ticks = []
+    for i, (code, move) in enumerate(zip(picks, moves)):
+        prices[code] = round(prices[code] * (1 + move), 2)
+        ticks.append((round(i * interval, 3), str(code), prices[code]))
+    return ticks
+
+
+def filler(padding):
+    # 模擬真實頁面中與解析無關的選單、廣告及其他表格
+    return ''.join(f'<div class="nav"><a href="/market/{i}.php" title="其他連結{i}">其他連結{i}</a>'
+                   f'<table class="other"><tr><td>{i}</td><td>無關資料 {i}</td></tr></table></div>'
+                   for i in range(padding))
+
+
+def index_page(links, padding=0):
+    anchors = '\n'.join(f'<a href="{href}" title="{title}">{title}</a>' for title, href in links)
+    return (f'<html><head><meta charset="utf-8"></head><body>{filler(padding)}<div class="menu">{anchors}</div>'
+            f'{filler(padding)}</body></html>')
+
+
+def category_page(title, codes, padding=0):
+    rows = ''.join(f'<tr><td>{code}</td><td>{title} {code}</td><td>{10 + i % 90}.{i % 100:02d}</td></tr>'
+                   for i, code in enumerate(codes))
+    return (f'<html><head><meta charset="utf-8"></head><body>{filler(padding)}<h1>{title}</h1>'
+            f'<table id="matrix"><tr><td><font>代號</font></td><td><font>名稱</font></td><td><font>價格</font></td></tr>'
+            f'{rows}</table>{filler(padding)}</body></html>')
+
+
+def taiex_page(padding=0):
+    return (f'<html><head><meta charset="utf-8"></head><body>{filler(padding)}'
+            '<table class="indexpagetable">'
+            '<tr><td>指數</td><td>漲跌</td><td>漲跌比例</td><td>今年表現</td></tr>'
+            '<tr><td>22000.50</td><td>-120.25</td><td>-0.54%</td><td>+12.30%</td></tr>'
+            f'</table>{filler(padding)}</body></html>')
+
+
+def write_stockq_fixtures(fixture_dir, padding=0):
+    """
+    將合成的 StockQ 首頁、各分類頁及大盤頁寫入 fixture_dir，檔名規則與 StockQServer 相同
+
+    :param padding: 每頁前後加入的無關區塊數量，用於模擬大型頁面
+    """
+    from HttpClient import fixture_path
+    os.makedirs(fixture_dir, exist_ok=True)
+    links = [(title, f'/etf/synthetic_{i}.php') for i, title in enumerate(CATEGORY_PAGES)]
+    pages = {'/etf': index_page(links, padding), '/index/TWSE.php': taiex_page(padding)}
+    for (title, href) in links:
+        pages[href] = category_page(title, CATEGORY_PAGES[title], padding)
+    for path, html in pages.items():
+        with open(fixture_path(fixture_dir, path), 'w', encoding='utf-8') as f:
+            f.write(html)
+    return fixture_dir
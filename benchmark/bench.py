@@ -0,0 +1,197 @@
+"""
+效能基準測試，不需券商帳號或網路：以 FakeShioaji 取代 shioaji，並以本地伺服器重播 StockQ 頁面
+
+用法：
+    python benchmark/bench.py [--sizes 10,1000,100000] [--repeat 3] [--dpi 300]
+                              [--fixtures 頁面資料夾] [--output results.json] [--compare 舊結果.json]
+
+未指定 --fixtures 時會使用合成的 StockQ 頁面；可先以 StockQServer.py --record 保存真實頁面
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path[:0] = [BENCH_DIR, ROOT_DIR]
+
+import FakeShioaji  # noqa: E402
+
+FakeShioaji.install()
+
+import matplotlib  # noqa: E402
+
+matplotlib.use('Agg')
+
+from SyntheticPortfolio import synthetic_positions_detail, write_stockq_fixtures  # noqa: E402
+from StockQServer import StockQServer  # noqa: E402
+
+CHART_METHODS = ['position_pie', 'loss_bar_with_type', 'value_bar_chart', 'max_holdings_text',
+                 'daily_position_changes', 'combined_holdings_and_changes']
+CHART_CONFIGS = [
+    ['position_pie', (0, 0), (1, 1)],
+    ['loss_bar_with_type', (0, 1), (1, 1)],
+    ['value_bar_chart', (1, 0), (1, 1)],
+    ['combined_holdings_and_changes', (1, 1), (1, 1)],
+]
+
+
+def measure(fn, repeat, setup=None):
+    durations = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started_at = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started_at)
+    return {'min': min(durations), 'median': statistics.median(durations), 'mean': statistics.mean(durations)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_etf_category(server, repeat, results):
+    from HttpClient import HttpClient
+    from TWStock import ETFCategory
+
+    client = HttpClient(rate=10_000, burst=10_000)
+    cache_dir = tempfile.mkdtemp()
+
+    def build(force_refresh):
+        return ETFCategory(cache_dir=cache_dir, force_refresh=force_refresh, http_client=client,
+                           root_query_url=server.root_url)
+
+    results.append({'name': 'ETFCategory.cold', 'size': None, **measure(lambda: build(True), repeat)})
+    results.append({'name': 'ETFCategory.warm', 'size': None, **measure(lambda: build(False), repeat)})
+    return build(False)
+
+
+def bench_account(sizes, etf_category, repeat, results):
+    from StockAccount import ShioajiStockAccount
+
+    for n in sizes:
+        FakeShioaji.FakeShioaji.n_positions = n
+        account = ShioajiStockAccount(api_key='', secret_key='')
+        results.append({'name': 'list_positions_detail', 'size': n,
+                        **measure(lambda: account.list_positions_detail(etf_category=etf_category), repeat)})
+
+    account = ShioajiStockAccount(api_key='', secret_key='')
+    cache_dir = tempfile.mkdtemp()
+    cache_path = os.path.join(cache_dir, 'loss_summary_cache.json')
+
+    def clear_cache():
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+
+    results.append({'name': 'get_all_loss_summary.cold', 'size': None,
+                    **measure(lambda: account.get_all_loss_summary(cache_dir=cache_dir), repeat, setup=clear_cache)})
+    results.append({'name': 'get_all_loss_summary.warm', 'size': None,
+                    **measure(lambda: account.get_all_loss_summary(cache_dir=cache_dir), repeat)})
+
+
+def bench_charts(sizes, dpi, repeat, results):
+    import matplotlib.pyplot as plt
+    from GenFigure import PositionFigure
+
+    output_dir = tempfile.mkdtemp()
+    for n in sizes:
+        figure = PositionFigure(synthetic_positions_detail(n))
+        for method_name in CHART_METHODS:
+            def render():
+                fig, ax = plt.subplots(figsize=(8, 6))
+                getattr(figure, method_name)(ax)
+                fig.canvas.draw()
+                plt.close(fig)
+
+            results.append({'name': f'PositionFigure.{method_name}', 'size': n,
+                            **measure(render, repeat, setup=figure.invalidate)})
+
+        save_path = os.path.join(output_dir, f'{n}_stock_positions.jpg')
+        results.append({'name': 'PositionFigure.custom_combined_charts', 'size': n,
+                        **measure(lambda: figure.custom_combined_charts(CHART_CONFIGS, save_path=save_path, dpi=dpi),
+                                  repeat, setup=figure.invalidate)})
+
+
+def bench_streaming(sizes, repeat, results, n_ticks=100_000):
+    from SyntheticPortfolio import synthetic_ticks
+    from Streaming import LiveValuation
+
+    for n in sizes:
+        positions = synthetic_positions_detail(n)
+        ticks = synthetic_ticks(positions, n_ticks)
+        holder = {}
+
+        def setup():
+            holder['valuation'] = LiveValuation(positions)
+
+        def apply_ticks():
+            apply = holder['valuation'].apply
+            for _, code, price in ticks:
+                apply(code, price)
+
+        results.append({'name': f'LiveValuation.apply.{n_ticks}_ticks', 'size': n,
+                        **measure(apply_ticks, repeat, setup=setup)})
+        results.append({'name': 'LiveValuation.snapshot', 'size': n,
+                        **measure(lambda: holder['valuation'].snapshot(), repeat)})
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, 'r') as f:
+        baseline = {(r['name'], r['size']): r for r in json.load(f)['results']}
+    print(f'\n與 {baseline_path} 比較 (median)')
+    for r in results:
+        old = baseline.get((r['name'], r['size']))
+        if old is None:
+            continue
+        print(f"{r['name']:<45}{str(r['size']):>8}{old['median']:>10.4f}{r['median']:>10.4f}"
+              f"{r['median'] / old['median']:>8.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TWStockPositionPlotter benchmark')
+    parser.add_argument('--sizes', default='10,1000,100000', help='持倉筆數，以逗號分隔')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--fixtures', default=None, help='保存 StockQ 頁面的資料夾')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', default=None, help='要比較的舊結果 JSON')
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(',')]
+
+    fixture_dir = args.fixtures or write_stockq_fixtures(tempfile.mkdtemp())
+    results = []
+    with StockQServer(fixture_dir) as server:
+        etf_category = bench_etf_category(server, args.repeat, results)
+    bench_account(sizes, etf_category, args.repeat, results)
+    bench_streaming(sizes, args.repeat, results)
+    bench_charts(sizes, args.dpi, args.repeat, results)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for r in results:
+        print(f"{r['name']:<45}{str(r['size']):>8}{r['median']:>10.4f} 秒")
+    print(f'結果已保存至: {args.output}')
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+比對 StockQParser 的精簡解析與原本整頁 BeautifulSoup(html.parser) 解析的結果，並記錄耗時及記憶體峰值
+
+用法：
+    python benchmark/check_parsers.py [--fixtures 頁面資料夾] [--padding 2000] [--repeat 5]
+
+未指定 --fixtures 時使用合成頁面 (--padding 控制頁面大小)；結果不一致時以非零狀態碼結束
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from glob import glob
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCH_DIR, os.path.dirname(BENCH_DIR)]
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+import StockQParser  # noqa: E402
+
+LINK_TITLES = ['高股息ETF', '正2反1 槓桿型ETF', '台灣ETF', '美國政府長期公債ETF', '投資級公司債ETF',
+               '非投資等級公司債ETF', '新興市場債ETF']
+
+
+# 以下為原本 TWStock/ETFCategory 中的整頁解析邏輯，作為比對基準
+def reference_taiex(html):
+    page = BeautifulSoup(html, 'html.parser')
+    taiex_index_page_table = page.find('table', {'class': "indexpagetable"})
+    if taiex_index_page_table is None:
+        return None
+    taiex_index_table = taiex_index_page_table.find_all('tr')
+    if len(taiex_index_table) != 2:
+        return None
+    taiex_index_title = [t.text for t in taiex_index_table[0].find_all('td')]
+    taiex_index_value = [v.text for v in taiex_index_table[1].find_all('td')]
+    return dict(zip(taiex_index_title, taiex_index_value))
+
+
+def reference_links(html, titles):
+    page = BeautifulSoup(html, 'html.parser')
+    links = {}
+    for title in titles:
+        a = page.find('a', title=title)
+        if a is not None:
+            links[title] = a['href']
+    return links
+
+
+def reference_matrix_codes(html):
+    page = BeautifulSoup(html, 'html.parser')
+    codes = []
+    for t in page.find_all('table', id='matrix'):
+        for p in t.find_all('tr'):
+            etf_tag = p.find('td')
+            if etf_tag.find('font'):
+                continue
+            codes.append(str(etf_tag.contents[0]))
+    return codes
+
+
+def measure(fn, html, repeat):
+    durations = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        result = fn(html)
+        durations.append(time.perf_counter() - started_at)
+    tracemalloc.start()
+    fn(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, statistics.median(durations), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='StockQ 頁面解析結果比對')
+    parser.add_argument('--fixtures', default=None)
+    parser.add_argument('--padding', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    fixture_dir = args.fixtures
+    if fixture_dir is None:
+        from SyntheticPortfolio import write_stockq_fixtures
+        fixture_dir = write_stockq_fixtures(tempfile.mkdtemp(), padding=args.padding)
+
+    print(f'解析器: {StockQParser.PARSER}')
+    mismatched = 0
+    for path in sorted(glob(os.path.join(fixture_dir, '*.html'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            html = f.read()
+        if 'indexpagetable' in html:
+            pairs = (reference_taiex, StockQParser.parse_taiex)
+        elif 'matrix' in html:
+            pairs = (reference_matrix_codes, lambda h: list(StockQParser.iter_matrix_codes(h)))
+        else:
+            pairs = (lambda h: reference_links(h, LINK_TITLES), lambda h: StockQParser.find_links(h, LINK_TITLES))
+        expected, old_seconds, old_peak = measure(pairs[0], html, args.repeat)
+        actual, new_seconds, new_peak = measure(pairs[1], html, args.repeat)
+        same = expected == actual
+        mismatched += not same
+        print(f"{os.path.basename(path):<40}{len(html) / 1024:>8.0f} KB  "
+              f"{old_seconds * 1000:>8.1f} -> {new_seconds * 1000:>7.1f} ms  "
+              f"{old_peak / 1024 / 1024:>6.1f} -> {new_peak / 1024 / 1024:>5.1f} MB  {'一致' if same else '不一致'}")
+    sys.exit(1 if mismatched else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+比對 PositionFigure.publish 與 custom_combined_charts (savefig, bbox_inches='tight') 輸出的圖片尺寸及像素，
+包含超出圖形範圍的過期資料標題
+
+用法：
+    python benchmark/check_render.py [--positions 50] [--dpi 100]
+
+尺寸或像素不一致時以非零狀態碼結束
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCH_DIR, os.path.dirname(BENCH_DIR)]
+
+import matplotlib  # noqa: E402
+matplotlib.use('Agg')
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from GenFigure import PositionFigure  # noqa: E402
+from SyntheticPortfolio import synthetic_positions_detail  # noqa: E402
+from main import CHART_CONFIGS  # noqa: E402
+
+# 長度足以超出圖形左右邊界的標題
+LONG_STALE_NOTE = '；'.join(['持倉沿用 2026-01-02 的快照', 'ETF分類沿用 2026-01-02 08:00 的快取',
+                            '大盤資訊沿用 2026-01-02 的資料'] * 3)
+
+
+def compare(positions, stale_note, dpi, output_dir):
+    name = 'stale' if stale_note else 'plain'
+    savefig_path = os.path.join(output_dir, f'{name}_savefig.png')
+    publish_path = os.path.join(output_dir, f'{name}_publish.png')
+    PositionFigure(positions, stale_note=stale_note).custom_combined_charts(
+        CHART_CONFIGS, savefig_path, dpi=dpi, format='png')
+    for future in PositionFigure(positions, stale_note=stale_note).publish(
+            CHART_CONFIGS, [{'path': publish_path, 'format': 'png'}], dpi=dpi):
+        future.result()
+    expected = np.asarray(Image.open(savefig_path).convert('RGB'), dtype=np.int16)
+    actual = np.asarray(Image.open(publish_path).convert('RGB'), dtype=np.int16)
+    same = expected.shape == actual.shape and not np.abs(expected - actual).any()
+    print(f"{name:<8}savefig {expected.shape[1]}x{expected.shape[0]}  publish {actual.shape[1]}x{actual.shape[0]}  "
+          f"{'一致' if same else '不一致'}")
+    return same
+
+
+def main():
+    parser = argparse.ArgumentParser(description='publish 與 savefig 的輸出比對')
+    parser.add_argument('--positions', type=int, default=50)
+    parser.add_argument('--dpi', type=int, default=100)
+    args = parser.parse_args()
+
+    positions = synthetic_positions_detail(args.positions)
+    output_dir = tempfile.mkdtemp()
+    results = [compare(positions, stale_note, args.dpi, output_dir) for stale_note in (None, LONG_STALE_NOTE)]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+以 FakeShioaji 及本地重播的 StockQ 頁面執行 main.py，參數與 main.py 相同
+
+用法：
+    python benchmark/run_offline.py [子命令] [參數...]
+
+環境變數：
+    STOCKQ_FIXTURES   保存 StockQ 頁面的資料夾，未設定時使用合成頁面
+    FAKE_POSITIONS    FakeShioaji 回傳的持倉數量 (預設 50)
+    FAKE_SESSION_TTL  FakeShioaji 登入後 token 逾期的秒數，未設定時不會逾期
+    FAKE_LATENCY      FakeShioaji 每次 API 呼叫的模擬延遲秒數 (預設 0)
+    STOCKQ_PORT       StockQ 重播伺服器的連接埠 (預設隨機)，固定連接埠時 ETF 分類快取可跨次執行沿用
+    STOCKQ_LATENCY    StockQ 頁面每個回應的模擬延遲秒數 (預設 0)，可搭配 STAGE_BUDGETS、RUN_DEADLINE 測試超時
+
+常駐模式可執行 `python benchmark/run_offline.py daemon --run-on-start`，以 SIGUSR1 觸發更新、SIGTERM 結束
+"""
+import os
+import runpy
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path[:0] = [BENCH_DIR, ROOT_DIR]
+
+import FakeShioaji  # noqa: E402
+from StockQServer import StockQServer  # noqa: E402
+
+if __name__ == '__main__':
+    session_ttl = os.getenv('FAKE_SESSION_TTL')
+    FakeShioaji.install(n_positions=int(os.getenv('FAKE_POSITIONS', 50)),
+                        latency=float(os.getenv('FAKE_LATENCY', 0)),
+                        session_ttl=float(session_ttl) if session_ttl else None)
+    fixture_dir = os.getenv('STOCKQ_FIXTURES')
+    if not fixture_dir:
+        from SyntheticPortfolio import write_stockq_fixtures
+        fixture_dir = write_stockq_fixtures(tempfile.mkdtemp())
+    server = StockQServer(fixture_dir, port=int(os.getenv('STOCKQ_PORT', 0)),
+                          latency=float(os.getenv('STOCKQ_LATENCY', 0))).start()
+    os.environ['STOCKQ_ROOT_URL'] = server.root_url
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    sys.argv = [os.path.join(ROOT_DIR, 'main.py')] + sys.argv[1:]
+    try:
+        runpy.run_path(sys.argv[0], run_name='__main__')
+    finally:
+        server.stop()
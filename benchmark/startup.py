@@ -0,0 +1,98 @@
+"""
+各子命令的啟動時間基準測試：在子行程中以 run_offline.py 執行每個子命令，記錄總耗時及載入的重量級模組
+
+用法：
+    python benchmark/startup.py [--repeat 3] [--budget 1.0] [--output startup_results.json]
+
+輕量子命令 (balance、pnl、settlements、taiex) 的耗時超過 --budget 秒，
+或載入了不需要的重量級模組時，以非零狀態碼結束
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCH_DIR, os.path.dirname(BENCH_DIR)]
+
+HEAVY_MODULES = ['pandas', 'matplotlib', 'seaborn', 'bs4', 'numpy']
+# 各子命令允許載入的重量級模組
+ALLOWED_MODULES = {
+    'balance': set(),
+    'pnl': set(),
+    'settlements': {'pandas', 'numpy'},
+    'taiex': {'bs4'},
+    'positions': {'pandas', 'numpy', 'bs4'},
+    'render': {'pandas', 'numpy', 'matplotlib', 'seaborn'},
+    'all': set(HEAVY_MODULES),
+}
+LIGHT_COMMANDS = ['balance', 'pnl', 'settlements', 'taiex']
+
+# 在子行程結束時列出已載入的重量級模組
+PROBE = """
+import atexit, sys
+@atexit.register
+def _report_modules():
+    loaded = [m for m in {modules!r} if m in sys.modules]
+    sys.__stderr__.write('LOADED_MODULES=' + ','.join(loaded) + '\\n')
+import runpy
+sys.argv = [{runner!r}] + {args!r}
+runpy.run_path({runner!r}, run_name='__main__')
+"""
+
+
+def run_command(command, env):
+    code = PROBE.format(modules=HEAVY_MODULES, runner=os.path.join(BENCH_DIR, 'run_offline.py'), args=[command])
+    started_at = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True)
+    duration = time.perf_counter() - started_at
+    loaded = []
+    for line in completed.stderr.splitlines():
+        if line.startswith('LOADED_MODULES='):
+            loaded = [m for m in line.split('=', 1)[1].split(',') if m]
+    return duration, loaded, completed.returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(description='子命令啟動時間基準測試')
+    parser.add_argument('--commands', default='balance,pnl,settlements,taiex,positions,render,all')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--budget', type=float, default=1.0, help='輕量子命令的耗時上限 (秒)')
+    parser.add_argument('--output', default='startup_results.json')
+    args = parser.parse_args()
+
+    from SyntheticPortfolio import write_stockq_fixtures
+    output_dir = tempfile.mkdtemp()
+    env = dict(os.environ,
+               STOCKQ_FIXTURES=write_stockq_fixtures(tempfile.mkdtemp()),
+               PRIVATE_OUTPUT_DIR=output_dir, PUBLIC_OUTPUT_DIR=output_dir, MPLBACKEND='Agg')
+
+    results = []
+    failed = False
+    for command in args.commands.split(','):
+        durations, loaded = [], []
+        for _ in range(args.repeat):
+            duration, loaded, returncode = run_command(command, env)
+            durations.append(duration)
+        unexpected = sorted(set(loaded) - ALLOWED_MODULES[command])
+        median = statistics.median(durations)
+        over_budget = command in LIGHT_COMMANDS and median > args.budget
+        failed = failed or over_budget or bool(unexpected)
+        results.append({'command': command, 'median': median, 'min': min(durations),
+                        'loaded_modules': loaded, 'unexpected_modules': unexpected, 'over_budget': over_budget})
+        print(f"{command:<12}{median:>8.3f} 秒  載入: {','.join(loaded) or '-'}"
+              f"{'  超出時間上限' if over_budget else ''}{'  不應載入: ' + ','.join(unexpected) if unexpected else ''}")
+
+    with open(args.output, 'w') as f:
+        json.dump({'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': sys.version.split()[0],
+                   'results': results}, f, indent=2)
+    print(f'結果已保存至: {args.output}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,83 +1,612 @@
-from StockAccount import ShioajiStockAccount
+# 只匯入輕量模組；shioaji、pandas、matplotlib、seaborn、BeautifulSoup 等在需要的子命令中才匯入
 from datetime import datetime
-from TWStock import TWStock
-from GenFigure import PositionFigure
+from concurrent.futures import ThreadPoolExecutor
+from Pipeline import Pipeline
+from Metrics import metrics
 from dotenv import load_dotenv
-from glob import glob
+import argparse
+import json
 import os
 
+# 定義要顯示的圖表及其布局
+CHART_CONFIGS = [
+    ['position_pie', (0, 0), (1, 1)],
+    ['loss_bar_with_type', (0, 1), (1, 1)],
+    ['value_bar_chart', (1, 0), (1, 1)],
+    ['combined_holdings_and_changes', (1, 1), (1, 1)],
+    # ['combined_holdings_and_changes', (2, 0), (1, 1)]  # 新增的方法
+]
+# 歷史走勢圖的布局，持倉歷史至少有兩天時才會繪製
+HISTORY_CHART_CONFIGS = [
+    ['allocation_history', (0, 0), (1, 1)],
+    ['unrealized_pnl_history', (0, 1), (1, 1)],
+    ['daily_value_change', (1, 0), (1, 1)],
+    ['drawdown_history', (1, 1), (1, 1)],
+]
 
-if __name__ == '__main__':
-    load_dotenv()
-    private_output_dir = '.'
-    public_output_dir = '.'
-    shioaji_api_key = os.getenv('SHIOAJI_API_KEY')
-    shioaji_secret_key = os.getenv('SHIOAJI_SECRET_KEY')
-    if 'PRIVATE_OUTPUT_DIR' in os.environ:
-        private_output_dir = os.getenv('PRIVATE_OUTPUT_DIR')
-    if 'PUBLIC_OUTPUT_DIR' in os.environ:
-        public_output_dir = os.getenv('PUBLIC_OUTPUT_DIR')
+ALL_STAGES = ['balance', 'raw_positions', 'etf_category', 'positions', 'loss_summary', 'settlements', 'render',
+              'taiex', 'caption']
+# 需要登入券商的階段
+BROKER_STAGES = {'balance', 'raw_positions', 'positions', 'loss_summary', 'settlements'}
+# 各子命令需要執行的階段
+COMMAND_STAGES = {
+    'balance': ['balance'],
+    'positions': ['raw_positions', 'etf_category', 'positions'],
+    'pnl': ['loss_summary'],
+    'settlements': ['settlements'],
+    'taiex': ['taiex', 'caption'],
+    'all': ALL_STAGES,
+}
 
-    # init ShioajiStockAccount object
-    myAccount = ShioajiStockAccount(
-        api_key=shioaji_api_key,
-        secret_key=shioaji_secret_key
-    )
+# 查詢券商或爬取網頁的階段的時間預算 (秒)，可由 STAGE_BUDGETS 環境變數覆寫
+STAGE_BUDGETS = {
+    'balance': 30,
+    'raw_positions': 60,
+    'etf_category': 120,
+    'loss_summary': 120,
+    'settlements': 30,
+    'taiex': 30,
+}
 
-    try:
+
+def stage_budgets():
+    """
+    各階段的時間預算，STAGE_BUDGETS 環境變數的格式為 etf_category=60,taiex=10，0 表示不限制
+    """
+    budgets = dict(STAGE_BUDGETS)
+    for item in filter(None, (v.strip() for v in os.getenv('STAGE_BUDGETS', '').split(','))):
+        name, _, seconds = item.partition('=')
+        try:
+            budgets[name.strip()] = float(seconds) or None
+        except ValueError:
+            print(f'無法解析的時間預算: {item}，略過')
+    return budgets
+
+
+def join_abandoned_stages(pipeline):
+    """
+    登出券商或開始下一個工作前，等待超時的階段結束，最多等待 STAGE_ABANDON_GRACE 秒 (預設 10)
+    """
+    if pipeline is not None and pipeline.abandoned:
+        pipeline.join_abandoned(float(os.getenv('STAGE_ABANDON_GRACE', 10)))
+
+
+def run_deadline():
+    """
+    整體執行的時間上限 (秒)，由 RUN_DEADLINE 環境變數設定 (預設 600，0 表示不限制)
+    """
+    return float(os.getenv('RUN_DEADLINE', 600)) or None
+
+
+def fetch_etf_category(private_output_dir, pipeline):
+    """
+    爬取 ETF 分類；部分頁面沿用過期快取時將 etf_category 階段標示為過期，完全無法取得時拋出例外，
+    由 Pipeline 改用先前的快取
+    """
+    from TWStock import ETFCategory
+    etf_category = ETFCategory(cache_dir=private_output_dir)
+    if etf_category.etf_category is None:
+        raise RuntimeError('無法取得ETF分類')
+    if etf_category.stale_pages:
+        saved_at = datetime.fromtimestamp(min(etf_category.stale_pages.values()))
+        pipeline.mark_stale('etf_category', f'部分ETF分類頁面沿用 {saved_at:%Y-%m-%d %H:%M} 的快取')
+    return etf_category
+
+
+def fetch_taiex():
+    """
+    查詢大盤資訊；無法取得時拋出例外，由 Pipeline 改用大盤歷史中的資料
+    """
+    from TWStock import TWStock
+    taiex = TWStock.get_taiex_info()
+    if taiex is None:
+        raise RuntimeError('無法取得大盤資訊')
+    return taiex
+
+
+def last_etf_category(private_output_dir):
+    """
+    以快取中先前爬取的頁面建立 ETFCategory，不發出任何請求；沒有快取時回傳 None
+    """
+    from TWStock import ETFCategory
+    etf_category = ETFCategory(cache_dir=private_output_dir, offline=True)
+    if etf_category.etf_category is None:
+        return None
+    saved_at = datetime.fromtimestamp(min(etf_category.stale_pages.values()))
+    return etf_category, f'ETF分類沿用 {saved_at:%Y-%m-%d %H:%M} 的快取'
+
+
+def last_positions(private_output_dir):
+    """
+    持倉歷史中最近一筆快照；沒有任何快照時回傳 None
+    """
+    from HistoryStore import PositionHistory
+    position_history = PositionHistory(f'{private_output_dir}/position_history.db')
+    dates = position_history.dates()
+    if not dates:
+        return None
+    positions = position_history.read(start=dates[-1], end=dates[-1]).drop(columns=['日期'])
+    return positions, f'持倉沿用 {dates[-1]:%Y-%m-%d} 的快照'
+
+
+def last_taiex(private_output_dir):
+    """
+    大盤歷史中最近一個交易日的大盤資訊 (另含日期欄位)；沒有任何資料時回傳 None
+    """
+    from HistoryStore import TaiexHistory
+    latest = TaiexHistory(f'{private_output_dir}/taiex_history.db').latest()
+    if latest is None:
+        return None
+    date, taiex = latest
+    taiex['日期'] = date
+    return taiex, f'大盤資訊沿用 {date:%Y-%m-%d} 的資料'
+
+
+def build_pipeline(myAccount, private_output_dir, public_output_dir, statistics_days, etf_category=None, taiex=None,
+                   stages=ALL_STAGES, to_csv=False, stale=None, fatal=None):
+    """
+    建立單一帳戶的執行流程；查詢券商及爬取網頁的階段有時間預算，超過預算或失敗時沿用先前的資料並標示為過期
+
+    :param etf_category: 已取得的 ETFCategory，提供時不再重新爬取 (批次模式中各帳戶共用)
+    :param taiex: 已取得的大盤資訊，提供時不再重新爬取 (批次模式中各帳戶共用)
+    :param stages: 要執行的階段名稱，須包含其相依的階段
+    :param to_csv: 是否另外匯出當日持倉 CSV
+    :param stale: 提供的 etf_category 或 taiex 為過期資料時的說明文字，{階段名稱: 說明}
+    :param fatal: 不沿用先前資料的錯誤判斷函式，見 Pipeline
+    """
+    def show_balance():
         # 帳務：查詢銀行帳戶餘額
-        print(f"查詢目前 ({myAccount.account_balance.date}) 銀行帳戶餘額為新台幣 {myAccount.account_balance.acc_balance}")
+        account_balance = myAccount.account_balance
+        print(f"查詢目前 ({account_balance.date}) 銀行帳戶餘額為新台幣 {account_balance.acc_balance}")
 
+    def fetch_positions():
         # 查詢持倉
-        # myPositions = myAccount.list_positions(is_df=True)
-        myPositions = myAccount.list_positions_detail(to_csv=True, output_dir=private_output_dir)
-        # print(myPositions)
+        return myAccount.list_positions(is_df=True)
 
+    def classify_positions(raw_positions, etf_category):
+        from HistoryStore import PositionHistory
+        # 每日持倉快照寫入持倉歷史資料庫，沿用先前快照時不再寫入
+        position_history = None
+        if 'raw_positions' not in pipeline.stale:
+            position_history = PositionHistory(f'{private_output_dir}/position_history.db')
+        return myAccount.classify_positions(raw_positions, etf_category=etf_category, history=position_history,
+                                            to_csv=to_csv, output_dir=private_output_dir)
+
+    def show_loss_summary():
         # 查詢已實現損益
-        myLossSummary = myAccount.get_all_loss_summary()
+        myLossSummary = myAccount.get_all_loss_summary(cache_dir=private_output_dir)
         print(f"統計{min([year for year in myLossSummary.keys() if type(year)==int])}年至今的已實現損益為{myLossSummary['total']['pnl']} ({myLossSummary['total']['pr_ratio']}%)")
 
-        # # 查詢交割資訊
+    def show_settlements():
+        # 查詢交割資訊
         settlements = myAccount.settlements(is_df=True)
         print('交割資訊如下：')
         print(settlements)
 
-        # 繪製持倉類型各項圖
-        myPositionFigure = PositionFigure(myPositions)
-        # 定義要顯示的圖表及其布局
-        chart_configs = [
-            ['position_pie', (0, 0), (1, 1)],
-            ['loss_bar_with_type', (0, 1), (1, 1)],
-            ['value_bar_chart', (1, 0), (1, 1)],
-            ['combined_holdings_and_changes', (1, 1), (1, 1)],
-            # ['combined_holdings_and_changes', (2, 0), (1, 1)]  # 新增的方法
-        ]
-
-        myPositionFigure.custom_combined_charts(chart_configs, save_path=f'{public_output_dir}/{datetime.now().strftime("%Y%m%d")}_stock_positions.jpg')
-        # myPositionFigure.save_individual_charts(chart_configs, save_dir=f'{public_output_dir}/{datetime.now().strftime("%Y%m%d")}_stock_positions', format='jpg')
-
-        # 查詢大盤資訊
-        taiex_info = TWStock.get_taiex_info()
+    def render_positions(positions):
+        date = datetime.now()
+        render_figure(positions, public_output_dir, date, render_cache_dir=f'{private_output_dir}/render_cache',
+                      series=load_series(private_output_dir, date),
+                      stale_note='；'.join(pipeline.stale_sources('render').values()) or None)
+
+    def write_taiex_caption(taiex):
+        from HistoryStore import TaiexHistory
+        stale_note = pipeline.stale.get('taiex')
+        taiex_history = TaiexHistory(f'{private_output_dir}/taiex_history.db')
+        # 以報價所屬的交易日期為準，休市日執行時不會將前一個交易日的資料記為新的一天
+        session_date = taiex.get('日期') or taiex_history.session_date(taiex)
         with open(f'{public_output_dir}/{datetime.now().strftime("%Y%m%d")}_caption.txt', 'w') as f:
-            date_string = datetime.now().strftime("%Y年%m月%d日")
-            string_format = f"{date_string}大盤加權指數：\n開盤{float(taiex_info['指數'])-float(taiex_info['漲跌']):.2f}\n漲跌指數為{taiex_info['漲跌']}({taiex_info['漲跌比例']})\n最後收{taiex_info['指數']}\n今年漲跌幅：{taiex_info['今年表現']}"
+            date_string = session_date.strftime("%Y年%m月%d日")
+            string_format = f"{date_string}大盤加權指數：\n開盤{float(taiex['指數'])-float(taiex['漲跌']):.2f}\n漲跌指數為{taiex['漲跌']}({taiex['漲跌比例']})\n最後收{taiex['指數']}\n今年漲跌幅：{taiex['今年表現']}"
+            if stale_note:
+                string_format += f"\n(資料並非最新：{stale_note})"
             f.write(string_format)
             print(string_format)
 
-        # 產生近七天交易日的大盤文字資訊
-        TWSTock_perDay_path = sorted(glob(f'{public_output_dir}/*_caption.txt'), key=os.path.getctime)
-        TWSTock_perDay_path.reverse()
-        statistics_days = 7
+        # 產生近 N 個交易日的大盤文字資訊，過期的大盤資訊不寫入歷史
+        if not stale_note:
+            taiex_history.put(string_format, taiex, date=session_date)
         with open(f'{public_output_dir}/{datetime.now().strftime("%Y%m%d")}_caption_{statistics_days}dsummary.txt', 'w') as f:
-            if len(TWSTock_perDay_path) < statistics_days:
-                statistics_days = len(TWSTock_perDay_path)
-            for p in TWSTock_perDay_path[:statistics_days]:
-                with open(p, 'r') as fp:
-                    f.write(fp.read())
-                    f.write('\n\n')
+            for caption in taiex_history.latest_captions(statistics_days):
+                f.write(caption)
+                f.write('\n\n')
 
-    except Exception as e:
-        print(e)
+    # 各階段依相依關係同時執行，例如大盤資訊與已實現損益會與持倉查詢重疊進行
+    stage_defs = [
+        ('balance', show_balance, []),
+        ('raw_positions', fetch_positions, []),
+        ('etf_category', (lambda: fetch_etf_category(private_output_dir, pipeline)) if etf_category is None
+                         else lambda: etf_category, []),
+        ('positions', classify_positions, ['raw_positions', 'etf_category']),
+        ('loss_summary', show_loss_summary, []),
+        ('settlements', show_settlements, []),
+        ('render', render_positions, ['positions']),
+        ('taiex', fetch_taiex if taiex is None else lambda: taiex, []),
+        ('caption', write_taiex_caption, ['taiex']),
+    ]
+    # 超過時間預算或失敗時沿用的先前資料
+    fallbacks = {
+        'raw_positions': lambda: last_positions(private_output_dir),
+        'etf_category': lambda: last_etf_category(private_output_dir),
+        'taiex': lambda: last_taiex(private_output_dir),
+    }
+    budgets = stage_budgets()
+    pipeline = Pipeline(profile_dir=private_output_dir, deadline=run_deadline(), fatal=fatal)
+    for name, func, deps in stage_defs:
+        if name in stages:
+            pipeline.add(name, func, deps=deps, budget=budgets.get(name), fallback=fallbacks.get(name))
+    for name, note in (stale or {}).items():
+        pipeline.mark_stale(name, note)
+    return pipeline
+
+
+def load_series(private_output_dir, date):
+    """
+    更新持倉歷史的時間序列 (只計算新增的日期)，並讀取至 date 為止的資料
+    """
+    from HistoryStore import PositionHistory, PortfolioSeries
+    series = PortfolioSeries(PositionHistory(f'{private_output_dir}/position_history.db'))
+    series.update()
+    return series.read(end=date)
+
+
+def output_variants(path_prefix):
+    """
+    同一張圖要輸出的格式及尺寸：固定輸出 jpg，另可由 OUTPUT_VARIANTS 環境變數 (以逗號分隔) 加上
+    png、webp 及 thumb (最長邊 THUMBNAIL_SIZE 像素的 jpg 縮圖)
+    """
+    outputs = [{'path': f'{path_prefix}.jpg', 'format': 'jpg'}]
+    for variant in filter(None, (v.strip() for v in os.getenv('OUTPUT_VARIANTS', '').split(','))):
+        if variant == 'png':
+            outputs.append({'path': f'{path_prefix}.png', 'format': 'png'})
+        elif variant == 'webp':
+            outputs.append({'path': f'{path_prefix}.webp', 'format': 'webp', 'quality': 90})
+        elif variant == 'thumb':
+            outputs.append({'path': f'{path_prefix}_thumb.jpg', 'format': 'jpg', 'quality': 85,
+                            'max_size': int(os.getenv('THUMBNAIL_SIZE', 800))})
+        else:
+            print(f'未知的輸出格式: {variant}，略過')
+    return outputs
+
+
+def render_figure(positions, public_output_dir, date, render_cache_dir=None, series=None, stale_note=None,
+                  suffix=''):
+    """
+    :param suffix: 輸出檔名的後綴，例如即時估值的 _live，避免覆寫每日報表的圖片
+    """
+    from GenFigure import PositionFigure
+    # 繪製持倉類型各項圖，圖表資料未變更時沿用 render_cache_dir 中先前的圖片
+    # 每張組合圖只繪製一次，各種格式及尺寸在背景執行緒中編碼，繪製下一張圖時同時進行
+    myPositionFigure = PositionFigure(positions, render_cache_dir=render_cache_dir, series=series,
+                                      stale_note=stale_note)
+    futures = myPositionFigure.publish(CHART_CONFIGS, output_variants(f'{public_output_dir}/{date.strftime("%Y%m%d")}_stock_positions{suffix}'))
+    if series is not None and len(series[1]) >= 2:
+        futures += myPositionFigure.publish(HISTORY_CHART_CONFIGS, output_variants(f'{public_output_dir}/{date.strftime("%Y%m%d")}_stock_history{suffix}'))
+    # myPositionFigure.save_individual_charts(CHART_CONFIGS, save_dir=f'{public_output_dir}/{date.strftime("%Y%m%d")}_stock_positions', format='jpg')
+    return [future.result() for future in futures]
+
+
+def render_history(private_output_dir, public_output_dir, date=None):
+    """
+    以持倉歷史資料庫中的快照繪圖，不需登入券商
+
+    :param date: 快照日期 (YYYYMMDD)，預設為最近一筆快照
+    """
+    from HistoryStore import PositionHistory
+    position_history = PositionHistory(f'{private_output_dir}/position_history.db')
+    if date is None:
+        dates = position_history.dates()
+        if not dates:
+            print('持倉歷史資料庫中沒有任何快照')
+            return None
+        date = dates[-1]
+    else:
+        date = datetime.strptime(date, '%Y%m%d')
+    positions = position_history.read(start=date, end=date).drop(columns=['日期'])
+    if positions.empty:
+        print(f'持倉歷史資料庫中沒有 {date.strftime("%Y%m%d")} 的快照')
+        return None
+    render_figure(positions, public_output_dir, date, render_cache_dir=f'{private_output_dir}/render_cache',
+                  series=load_series(private_output_dir, date))
+    return date
+
+
+def run_stages(myAccount, private_output_dir, public_output_dir, statistics_days, etf_category=None, taiex=None,
+               stages=ALL_STAGES, to_csv=False, stale=None, fatal=None):
+    """
+    以已登入的帳戶執行指定階段並輸出各階段耗時
+    """
+    pipeline = build_pipeline(myAccount, private_output_dir, public_output_dir, statistics_days,
+                              etf_category=etf_category, taiex=taiex, stages=stages, to_csv=to_csv, stale=stale,
+                              fatal=fatal)
+    pipeline.run()
+    pipeline.report()
+    return pipeline
+
+
+def run_account(api_key, secret_key, private_output_dir, public_output_dir, statistics_days,
+                etf_category=None, taiex=None, stages=ALL_STAGES, to_csv=False, stale=None):
+    os.makedirs(private_output_dir, exist_ok=True)
+    os.makedirs(public_output_dir, exist_ok=True)
+
+    myAccount = None
+    if BROKER_STAGES.intersection(stages):
+        from StockAccount import ShioajiStockAccount
+        # init ShioajiStockAccount object
+        myAccount = ShioajiStockAccount(
+            api_key=api_key,
+            secret_key=secret_key
+        )
+
+    pipeline = None
+    try:
+        pipeline = run_stages(myAccount, private_output_dir, public_output_dir, statistics_days,
+                              etf_category=etf_category, taiex=taiex, stages=stages, to_csv=to_csv, stale=stale)
+        return pipeline
+    finally:
+        # 超時的階段可能仍在使用券商連線
+        join_abandoned_stages(pipeline)
+        if myAccount is not None:
+            myAccount.logout()
+            print('logout')
+
+
+def run_batch(profiles_path, private_output_dir, public_output_dir, statistics_days, max_workers=4):
+    """
+    批次處理多個帳戶：ETF 分類及大盤資訊只爬取一次供所有帳戶共用，各帳戶在有上限的執行緒池中同時執行，
+    單一帳戶失敗不影響其他帳戶
+
+    :param profiles_path: 帳戶設定 JSON 檔，內容為列表，每個元素包含 name、api_key、secret_key，
+                          可選擇性指定 private_output_dir、public_output_dir (預設為輸出資料夾下以 name 命名的子資料夾)
+    :param max_workers: 同時處理的帳戶數上限
+    """
+    with open(profiles_path, 'r', encoding='utf-8') as f:
+        profiles = json.load(f)
+
+    # 共用的市場資料，超過時間預算或無法取得時沿用先前的資料
+    budgets = stage_budgets()
+    shared = Pipeline(profile_dir=private_output_dir, deadline=run_deadline())
+    shared.add('etf_category', lambda: fetch_etf_category(private_output_dir, shared),
+               budget=budgets.get('etf_category'), fallback=lambda: last_etf_category(private_output_dir))
+    shared.add('taiex', fetch_taiex, budget=budgets.get('taiex'),
+               fallback=lambda: last_taiex(private_output_dir))
+    shared_data = shared.run()
+
+    def run_profile(profile):
+        print(f"開始處理帳戶 {profile['name']}")
+        return run_account(
+            api_key=profile['api_key'],
+            secret_key=profile['secret_key'],
+            private_output_dir=profile.get('private_output_dir', f"{private_output_dir}/{profile['name']}"),
+            public_output_dir=profile.get('public_output_dir', f"{public_output_dir}/{profile['name']}"),
+            statistics_days=statistics_days,
+            etf_category=shared_data.get('etf_category'),
+            taiex=shared_data.get('taiex'),
+            stale=shared.stale,
+        )
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {profile['name']: executor.submit(run_profile, profile) for profile in profiles}
+        for name, future in futures.items():
+            try:
+                pipeline = future.result()
+                # 沿用先前資料的階段不算失敗
+                if set(pipeline.errors) - set(pipeline.stale):
+                    failed.append(name)
+            except Exception as e:
+                print(f'帳戶 {name} 執行失敗: {e}')
+                failed.append(name)
+    print(f'批次處理完成：成功 {len(profiles) - len(failed)} 個帳戶，失敗 {len(failed)} 個帳戶 {failed if failed else ""}')
+    return failed
+
+
+def run_daemon(api_key, secret_key, private_output_dir, public_output_dir, statistics_days, run_on_start=False):
+    """
+    常駐模式：只登入一次並保留 ETF 分類，依排程執行工作，每個工作只需進行實際的查詢
+    - nightly: 完整流程，預設週一至週五 DAEMON_NIGHTLY_AT (22:00)
+    - intraday: 持倉快照，盤中每 DAEMON_INTRADAY_MINUTES 分鐘 (預設 30，0 表示停用)
+    - refresh: 完整流程，收到 SIGUSR1 時立即執行
+    """
+    from Daemon import Scheduler, AccountSession, WarmValue, daily_at, every, is_session_error
+    os.makedirs(private_output_dir, exist_ok=True)
+    os.makedirs(public_output_dir, exist_ok=True)
+
+    def build_etf_category():
+        from TWStock import ETFCategory
+        category = ETFCategory(cache_dir=private_output_dir)
+        if category.etf_category is None:
+            # 沒有可用的分類時不保留，交由工作中的 etf_category 階段重新爬取或沿用快取
+            raise RuntimeError('無法取得ETF分類')
+        return category
+
+    session = AccountSession(api_key, secret_key, max_age=float(os.getenv('SHIOAJI_SESSION_MAX_AGE', 20 * 3600)))
+    etf_category = WarmValue(build_etf_category, ttl=float(os.getenv('ETF_CACHE_TTL', 86400)))
+    metrics_dir = os.getenv('METRICS_DIR', private_output_dir)
+
+    def job(stages):
+        def run_job():
+            # 每個工作的指標各自輸出，不累積先前工作的資料
+            metrics.reset()
+
+            def run(myAccount):
+                # 同一個連線跨越多個工作，每個工作開始時重新查詢餘額、持倉等資料
+                myAccount.refresh()
+                try:
+                    warm_etf_category = etf_category.get()
+                except Exception as e:
+                    print(f'ETF分類無法取得: {e}')
+                    warm_etf_category = None
+                # 連線逾期造成的失敗不沿用持倉歷史，下游的繪圖不會先以過期資料覆寫輸出
+                pipeline = run_stages(myAccount, private_output_dir, public_output_dir, statistics_days,
+                                      etf_category=warm_etf_category, stages=stages, fatal=is_session_error)
+                # 超時的階段結束前不開始下一個工作或重新登入，避免與其共用連線及指標
+                join_abandoned_stages(pipeline)
+                # 階段失敗不會中斷流程，連線逾期造成的失敗交由 session 重新登入後重試
+                for error in pipeline.errors.values():
+                    if is_session_error(error):
+                        raise error
+                return pipeline
+            try:
+                return session.run(run)
+            finally:
+                metrics.write_json(f'{metrics_dir}/metrics.json')
+                metrics.write_prometheus(f'{metrics_dir}/twstock.prom')
+        return run_job
+
+    scheduler = Scheduler()
+    scheduler.add('nightly', job(ALL_STAGES), daily_at(os.getenv('DAEMON_NIGHTLY_AT', '22:00')))
+    intraday_minutes = int(os.getenv('DAEMON_INTRADAY_MINUTES', 30))
+    if intraday_minutes > 0:
+        scheduler.add('intraday', job(COMMAND_STAGES['positions']),
+                      every(intraday_minutes, start=os.getenv('DAEMON_INTRADAY_START', '09:00'),
+                            end=os.getenv('DAEMON_INTRADAY_END', '13:30')))
+    scheduler.add('refresh', job(ALL_STAGES))
+    scheduler.install_signal_handlers(refresh_job='refresh')
+    if run_on_start:
+        scheduler.trigger('refresh')
+    try:
+        scheduler.run()
+    finally:
+        session.logout()
+    return scheduler
+
+
+def run_stream(api_key, secret_key, private_output_dir, public_output_dir, replay=None, speed=None, interval=10.0):
+    """
+    即時持倉估值：以即時報價 (或重播的報價) 逐筆更新持倉價值，並每 interval 秒在有變化時重新繪圖
+
+    :param replay: 報價 CSV (時間,商品代碼,價格)，提供時以重播取代券商的即時報價
+    :param speed: 重播速度倍率，None 表示盡快送出
+    """
+    import signal
+    import time
+    from StockAccount import ShioajiStockAccount
+    from Streaming import LiveValuation, ReplayFeed, ShioajiFeed, ThrottledRenderer
+    from TWStock import ETFCategory
+    os.makedirs(private_output_dir, exist_ok=True)
+    os.makedirs(public_output_dir, exist_ok=True)
+
+    myAccount = ShioajiStockAccount(api_key=api_key, secret_key=secret_key)
+    try:
+        positions = myAccount.list_positions_detail(etf_category=ETFCategory(cache_dir=private_output_dir))
+        valuation = LiveValuation(positions)
+        renderer = ThrottledRenderer(
+            valuation,
+            # 每個畫面的報價都不同，不使用繪圖快取；輸出至 _live 圖片，不覆寫每日報表的圖片
+            lambda frame: render_figure(frame, public_output_dir, datetime.now(), suffix='_live'),
+            interval=interval,
+        ).start()
+        feed = ReplayFeed.from_csv(replay, speed=speed) if replay else ShioajiFeed(myAccount.api)
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+        signal.signal(signal.SIGINT, lambda *args: stopping.append(True))
+        started_at = time.monotonic()
+        feed.start(valuation.codes, valuation.apply)
+        while not stopping and not feed.join(timeout=1.0):
+            pass
+        feed.stop()
+        renderer.stop()
+        print(f'即時估值結束：{valuation.version} 筆報價，{time.monotonic() - started_at:.2f} 秒，'
+              f'重新繪圖 {renderer.renders} 次，目前部位價值 {valuation.total_value:,.0f}')
+        return valuation
     finally:
         myAccount.logout()
         print('logout')
+
+
+def run_dashboard(private_output_dir, host='127.0.0.1', port=8050):
+    """
+    本地儀表板：以 HTTP 提供持倉歷史中任一快照日期的圖表，直到收到 SIGTERM/SIGINT 為止
+    """
+    import signal
+    import threading
+    # 在請求的執行緒中繪圖，只能使用非互動式的後端
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    from Dashboard import Dashboard, DashboardServer, RenderCache
+    cache = RenderCache(max_entries=int(os.getenv('DASHBOARD_CACHE_ENTRIES', 128)),
+                        max_bytes=int(float(os.getenv('DASHBOARD_CACHE_MB', 128)) * 1024 * 1024))
+    dashboard = Dashboard(private_output_dir, {'positions': CHART_CONFIGS, 'history': HISTORY_CHART_CONFIGS},
+                          cache=cache)
+    server = DashboardServer(dashboard, host=host, port=port).start()
+    print(f'儀表板已啟動: {server.url}')
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stopping.set())
+    signal.signal(signal.SIGINT, lambda *args: stopping.set())
+    while not stopping.wait(1.0):
+        pass
+    server.stop()
+    print(f'儀表板結束，快取統計: {json.dumps(cache.stats(), ensure_ascii=False)}')
+    return dashboard
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='台股持倉資訊暨股票類型分類繪圖')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('all', help='執行完整流程 (預設)')
+    subparsers.add_parser('balance', help='查詢銀行帳戶餘額')
+    positions_parser = subparsers.add_parser('positions', help='查詢持倉並寫入持倉歷史')
+    positions_parser.add_argument('--csv', action='store_true', help='另外匯出當日持倉 CSV')
+    subparsers.add_parser('pnl', help='統計已實現損益')
+    subparsers.add_parser('settlements', help='查詢交割資訊')
+    subparsers.add_parser('taiex', help='更新大盤資訊及近 N 日摘要')
+    render_parser = subparsers.add_parser('render', help='以持倉歷史中的快照繪圖')
+    render_parser.add_argument('--date', default=None, help='快照日期 (YYYYMMDD)，預設為最近一筆')
+    batch_parser = subparsers.add_parser('batch', help='多帳戶批次模式')
+    batch_parser.add_argument('--profiles', default=os.getenv('ACCOUNT_PROFILES'), help='帳戶設定 JSON 檔')
+    batch_parser.add_argument('--workers', type=int, default=int(os.getenv('ACCOUNT_WORKERS', 4)),
+                              help='同時處理的帳戶數上限')
+    daemon_parser = subparsers.add_parser('daemon', help='常駐模式，維持券商連線並依排程執行')
+    daemon_parser.add_argument('--run-on-start', action='store_true', help='啟動後立即執行一次完整流程')
+    stream_parser = subparsers.add_parser('stream', help='以即時報價更新持倉估值並定期重新繪圖')
+    stream_parser.add_argument('--replay', default=None, help='重播的報價 CSV (時間,商品代碼,價格)')
+    stream_parser.add_argument('--speed', type=float, default=None, help='重播速度倍率，預設盡快送出')
+    stream_parser.add_argument('--interval', type=float, default=float(os.getenv('STREAM_RENDER_INTERVAL', 10)),
+                               help='重新繪圖的最短間隔秒數')
+    serve_parser = subparsers.add_parser('serve', help='本地儀表板，以 HTTP 提供各快照日期的圖表')
+    serve_parser.add_argument('--host', default=os.getenv('DASHBOARD_HOST', '127.0.0.1'))
+    serve_parser.add_argument('--port', type=int, default=int(os.getenv('DASHBOARD_PORT', 8050)))
+    args = parser.parse_args(argv)
+    if args.command is None:
+        args.command = 'batch' if os.getenv('ACCOUNT_PROFILES') else 'all'
+        args.profiles = os.getenv('ACCOUNT_PROFILES')
+        args.workers = int(os.getenv('ACCOUNT_WORKERS', 4))
+    return args
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    private_output_dir = '.'
+    public_output_dir = '.'
+    shioaji_api_key = os.getenv('SHIOAJI_API_KEY')
+    shioaji_secret_key = os.getenv('SHIOAJI_SECRET_KEY')
+    if 'PRIVATE_OUTPUT_DIR' in os.environ:
+        private_output_dir = os.getenv('PRIVATE_OUTPUT_DIR')
+    if 'PUBLIC_OUTPUT_DIR' in os.environ:
+        public_output_dir = os.getenv('PUBLIC_OUTPUT_DIR')
+    statistics_days = int(os.getenv('TAIEX_SUMMARY_DAYS', 7))
+    args = parse_args()
+
+    try:
+        if args.command == 'batch':
+            run_batch(args.profiles, private_output_dir, public_output_dir, statistics_days, max_workers=args.workers)
+        elif args.command == 'daemon':
+            run_daemon(shioaji_api_key, shioaji_secret_key, private_output_dir, public_output_dir, statistics_days,
+                       run_on_start=args.run_on_start)
+        elif args.command == 'stream':
+            run_stream(shioaji_api_key, shioaji_secret_key, private_output_dir, public_output_dir,
+                       replay=args.replay, speed=args.speed, interval=args.interval)
+        elif args.command == 'serve':
+            run_dashboard(private_output_dir, host=args.host, port=args.port)
+        elif args.command == 'render':
+            render_history(private_output_dir, public_output_dir, date=args.date)
+        else:
+            run_account(shioaji_api_key, shioaji_secret_key, private_output_dir, public_output_dir, statistics_days,
+                        stages=COMMAND_STAGES[args.command], to_csv=getattr(args, 'csv', False))
+    except Exception as e:
+        print(e)
+    finally:
+        # 輸出本次執行的指標，供 Prometheus textfile collector 收集
+        metrics_dir = os.getenv('METRICS_DIR', private_output_dir)
+        metrics.write_json(f'{metrics_dir}/metrics.json')
+        metrics.write_prometheus(f'{metrics_dir}/twstock.prom')